@@ -1,66 +1,215 @@
 import logging
-import pdb
-import requests
 import json
-import textwrap
+import hashlib
+import html
+import re
+from concurrent.futures import as_completed
 from requests.auth import HTTPBasicAuth
-from datetime import date
-from pprint import pprint
+from HttpSession import HttpSession
+from jobcontext import thread_pool
+
+# number of times to retry an update that fails with a version conflict
+CONFLICT_RETRIES = 3
+
+# number of pages to update at the same time
+DEFAULT_MAX_WORKERS = 8
+
+# timestamps on the page that change on every run without the list itself changing
+VOLATILE_PATTERNS = [
+    re.compile(r"(Master staff list updated|This page rendered on):\s*\d{4}-\d{2}-\d{2} \d{2}:\d{2}"),
+]
+
+# table cell and row ends, kept as separators when the markup is removed
+CELL_END = re.compile(r"</t[dh]\s*>", re.IGNORECASE)
+ROW_END = re.compile(r"</tr\s*>", re.IGNORECASE)
+TAG = re.compile(r"<[^>]*>")
+
+
+def fingerprint(html_content):
+    """
+    Calculate a fingerprint of the text of a page, cell by cell.
+    Confluence does not store the page body as it was uploaded, it adds elements like <tbody>
+    and attributes, and changes how characters are escaped. So the markup is removed except
+    for the cell and row boundaries, entities are decoded, volatile timestamps are removed
+    and whitespace is normalized.
+    :param html_content: HTML content in Confluence storage format.
+    :return: Hex digest of the normalized text.
+    """
+    text = CELL_END.sub("\x1f", html_content)
+    text = ROW_END.sub("\x1e", text)
+    text = html.unescape(TAG.sub(" ", text)).replace("\xa0", " ")
+    text = re.sub(r"[^\S\x1e\x1f]+", " ", text)
+    for pattern in VOLATILE_PATTERNS:
+        text = pattern.sub(r"\1:", text)
+    text = re.sub(r" ?([\x1e\x1f]) ?", r"\1", text).strip()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
 class Confluence:
-    def __init__(self, config, args, dry_run=False):
+    def __init__(self, config, args, dry_run=False, session=None):
         """
         Initialize the Confluence class with self.configuration.
         :param config: Dictionary containing configuration parameters.
         :param args: Command-line arguments.
         :param dry_run: If True, do not upload changes to Confluence.
+        :param session: Shared HttpSession, a new one is created if None.
         """
         self.base_url = config["confluence"]["base_url"]
-        self.auth     = requests.auth.HTTPBasicAuth(config["confluence"]["username"], config["confluence"]["api_key"])
+        self.auth     = HTTPBasicAuth(config["confluence"]["username"], config["confluence"]["api_key"])
         self.dry_run  = dry_run
+        self.session  = session or HttpSession(config)
+
+    def get_page(self, page_id):
+        """
+        Get a Confluence page including its body in storage format.
+        :param page_id: ID of the Confluence page.
+        :return: Dictionary with the page as returned by the Confluence API.
+        """
+        url = f"{self.base_url}/wiki/api/v2/pages/{page_id}"
+        params = {"body-format": "storage"}
+        response = self.session.get(url, params=params, auth=self.auth)
+        response.raise_for_status()
+        return response.json()
 
-    def update_staff_list_page(self, space_key, page_id, html_content):
+    def update_staff_list_page(self, space_key, page_id, html_content, page=None):
         """
         Update the Confluence page with the given space name and page ID with the provided HTML content.
         :param space_name: Name of the Confluence space.
         :param page_id: ID of the Confluence page to update.
         :param html_content: HTML content to update the page with.
+        :param page: The page as already fetched with get_page(), it is fetched again if None or on a version conflict.
         :return: True if the page was updated, False if no update was needed.
         """
         url = f"{self.base_url}/wiki/api/v2/pages/{page_id}"
-        # Retrieve current page
-        params = {"body-format": "storage"}
-        response = requests.get(url, params=params, auth=self.auth).json()
-        text = response["body"]["storage"]["value"]
 
+        # retry from the top if someone else updated the page in between
+        sent_version = None
+        for attempt in range(CONFLICT_RETRIES + 1):
+
+            # Retrieve current page, unless it was fetched in advance
+            response = page or self.get_page(page_id)
+            page = None
+            text = response["body"]["storage"]["value"]
+
+            # skip the update if nothing but the timestamps would change
+            if fingerprint(text) == fingerprint(html_content):
+
+                # a PUT retried after a 5xx reply gets a conflict if the first attempt was applied after all
+                if response["version"]["number"] == sent_version:
+                    logging.info(f"Page {page_id} was updated by an earlier attempt.")
+                    return True
+                logging.info(f"Page {page_id} is already up to date, not updating it.")
+                return False
+
+            # Build the new page content
+            content = {
+                "id": response["id"],
+                "status": "current",
+                "title": response["title"],
+                "body": {
+                    "storage": {"value": html_content, "representation": "storage"}
+                },
+                "version": {"number": response["version"]["number"] + 1},
+            }
 
-        # Build the new page content
+            # If we are in dry run mode, just return the content without uploading
+            if self.dry_run:
+                logging.info("Dry run mode: Not uploading changes to Confluence.")
+                logging.debug("Content to be uploaded:")
+                from pprint import pprint
+                pprint(content)
+                return True
+
+            # upload the new content to Confluence
+            sent_version = content["version"]["number"]
+            r = self.session.put(
+                url,
+                auth=self.auth,
+                data=json.dumps(content),
+                headers={"Content-Type": "application/json", "Accept": "application/json",},
+            )
+
+            # version conflict, fetch the new version number and try again
+            if r.status_code == 409 and attempt < CONFLICT_RETRIES:
+                logging.warning(f"Version conflict when updating page {page_id}, retrying...")
+                continue
+
+            r.raise_for_status()
+            return True
+
+    def get_child_pages(self, parent_id):
+        """
+        Get the child pages of a Confluence page.
+        :param parent_id: ID of the parent page.
+        :return: Dictionary of page title to page ID.
+        """
+        url = f"{self.base_url}/wiki/api/v2/pages/{parent_id}/children"
+        params = {"limit": 250}
+        children = {}
+        while url:
+            response = self.session.get(url, params=params, auth=self.auth)
+            response.raise_for_status()
+            result = response.json()
+            for child in result.get("results", []):
+                children[child["title"]] = child["id"]
+
+            # follow the pagination links, they already include the query parameters
+            next_link = result.get("_links", {}).get("next")
+            url = f"{self.base_url}{next_link}" if next_link else None
+            params = None
+        return children
+
+    def create_page(self, space_id, parent_id, title, html_content):
+        """
+        Create a new Confluence page.
+        :param space_id: ID of the Confluence space (not the space key).
+        :param parent_id: ID of the parent page.
+        :param title: Title of the new page.
+        :param html_content: HTML content of the new page.
+        :return: ID of the new page, None in dry run mode.
+        """
         content = {
-            "id": response["id"],
+            "spaceId": str(space_id),
             "status": "current",
-            "title": response["title"],
-            "body": {
-                "storage": {"value": html_content, "representation": "storage"}
-            },
-            "version": {"number": response["version"]["number"] + 1},
+            "title": title,
+            "parentId": str(parent_id),
+            "body": {"value": html_content, "representation": "storage"},
         }
 
-        # If we are in dry run mode, just return the content without uploading
         if self.dry_run:
-            logging.info("Dry run mode: Not uploading changes to Confluence.")
-            logging.debug("Content to be uploaded:")
-            pprint(content)
-            return True
+            logging.info(f"Dry run mode: Not creating page '{title}' in Confluence.")
+            return None
 
-
-        # upload the new content to Confluence
-        r = requests.put(
-            url,
+        r = self.session.post(
+            f"{self.base_url}/wiki/api/v2/pages",
             auth=self.auth,
             data=json.dumps(content),
             headers={"Content-Type": "application/json", "Accept": "application/json",},
         )
         r.raise_for_status()
-        return True
+        page_id = r.json()["id"]
+        logging.info(f"Created page '{title}' with ID {page_id}.")
+        return page_id
 
+    def publish_pages(self, space_key, pages, max_workers=DEFAULT_MAX_WORKERS, prefetched=None):
+        """
+        Update several Confluence pages concurrently.
+        :param space_key: Key of the Confluence space.
+        :param pages: Dictionary of page ID to the HTML content for that page.
+        :param max_workers: Maximum number of pages to update at the same time.
+        :param prefetched: Dictionary of page ID to the page as already fetched with get_page(), or None.
+        :return: Dictionary of page ID to True if updated, False if no update was needed
+                 and None if the update failed.
+        """
+        prefetched = prefetched or {}
+        results = {}
+        with thread_pool(max_workers) as executor:
+            futures = {executor.submit(self.update_staff_list_page, space_key, page_id, html_content, prefetched.get(page_id)): page_id for page_id, html_content in pages.items()}
+            for future in as_completed(futures):
+                page_id = futures[future]
+                try:
+                    results[page_id] = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to update page {page_id}: {e}")
+                    results[page_id] = None
+        return results
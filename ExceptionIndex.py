@@ -0,0 +1,174 @@
+import logging
+import re
+from datetime import datetime
+from fnmatch import translate
+from Schema import parse_date
+
+# service entry that allows every service to stay active
+ALL_SERVICES = "*"
+
+# services are given as "<service>" or as their column "<service> active"
+SERVICE_COLUMN_SUFFIX = " active"
+
+# shared empty exception set for users without exceptions
+NO_EXCEPTIONS = frozenset()
+
+
+class ExceptionIndex:
+    def __init__(self, exception_rows, now=None):
+        """
+        Compile the Exceptions sheet into an index, so the exceptions of a user are found with a few lookups
+        however many exceptions there are.
+        The first column holds a mail address, "@domain" or "*@domain" for a whole domain, or a pattern
+        with fnmatch wildcards: *, ? and [...]. The second column holds a comma-separated list of services, "*" for all
+        services. An optional third column holds the date the exceptions expire on.
+        Addresses and services are matched case-insensitively.
+        :param exception_rows: Rows of the Exceptions sheet, without the header.
+        :param now: Datetime to compare the expiry dates to, defaults to now.
+        """
+        now = now or datetime.now()
+        self.exact = {}
+        self.domains = {}
+        self.patterns = {}
+        self.expired = []
+        self.cache = {}
+
+        pattern_sources = {}
+        for row_number, row in enumerate(exception_rows, start=2):
+            entry = str(row[0]).strip().lower() if row and row[0] is not None else ""
+            if not entry:
+                continue
+            services = parse_services(row[1] if len(row) > 1 else None)
+            if not services:
+                logging.warning(f"Exceptions row {row_number}: no services given for {entry}, ignoring it.")
+                continue
+
+            # expired exceptions are reported instead of applied
+            expires = None
+            if len(row) > 2:
+                try:
+                    expires = parse_date(row[2])
+                except ValueError as e:
+                    logging.warning(f"Exceptions row {row_number}: {row[2]!r} is {e}, treating the exception for {entry} as permanent.")
+            if expires is not None and expires < now:
+                self.expired.append((entry, services, expires))
+                continue
+
+            # "@domain" is short for "*@domain"
+            if entry.startswith("@"):
+                entry = "*" + entry
+            spans = wildcard_spans(entry)
+            if not spans:
+                self.exact.setdefault(entry, set()).update(services)
+            elif entry.startswith("*@") and spans == [(0, 1)] and "@" not in entry[2:]:
+                self.domains.setdefault(entry[2:], set()).update(services)
+            else:
+                # patterns are indexed by the text before their first wildcard, or else after their last
+                key = pattern_key(entry, spans)
+                for service in services:
+                    pattern_sources.setdefault(key, {}).setdefault(service, []).append(translate(entry))
+
+        # one regex per key and service, matching if any of its patterns match
+        self.patterns = {key: {service: re.compile("|".join(sources)) for service, sources in by_service.items()}
+                         for key, by_service in pattern_sources.items()}
+        pattern_count = sum(len(sources) for by_service in pattern_sources.values() for sources in by_service.values())
+        logging.debug(f"Compiled {len(self.exact)} exceptions, {len(self.domains)} domains and {pattern_count} pattern entries, {len(self.expired)} expired.")
+
+    def lookup(self, user_mail):
+        """
+        Get the services a user is allowed to keep active.
+        :param user_mail: Mail address of the user.
+        :return: Frozen set of service columns, e.g. "github active", containing ALL_SERVICES if every service is allowed.
+        """
+        if user_mail is None:
+            return NO_EXCEPTIONS
+        user_mail = str(user_mail).strip().lower()
+        services = self.cache.get(user_mail)
+        if services is not None:
+            return services
+
+        # the exceptions of the address, its domain and the matching patterns are combined
+        services = set(self.exact.get(user_mail, NO_EXCEPTIONS))
+        _, at, domain = user_mail.rpartition("@")
+        if at:
+            services.update(self.domains.get(domain, NO_EXCEPTIONS))
+        if self.patterns:
+            for key in candidate_keys(user_mail):
+                for service, pattern in self.patterns.get(key, {}).items():
+                    if service not in services and pattern.match(user_mail):
+                        services.add(service)
+        services = frozenset(services) if services else NO_EXCEPTIONS
+        self.cache[user_mail] = services
+        return services
+
+    def report_expired(self):
+        """
+        Log the exceptions that have expired, so they can be renewed or removed from the sheet.
+        """
+        for entry, services, expires in self.expired:
+            logging.warning(f"Exception for {entry} expired on {expires.date()}: {', '.join(sorted(services))}")
+
+
+def wildcard_spans(pattern):
+    """
+    Find the wildcards of a pattern the way fnmatch reads them: *, ? and [...] sets. A [ without a closing ]
+    is a plain character.
+    :return: List of (start, end) positions of the wildcards, empty if the pattern is a plain address.
+    """
+    spans = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] in "*?":
+            spans.append((i, i + 1))
+        elif pattern[i] == "[":
+            # a ] right after [ or [! is part of the set
+            j = i + 1
+            if j < len(pattern) and pattern[j] == "!":
+                j += 1
+            if j < len(pattern) and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j >= 0:
+                spans.append((i, j + 1))
+                i = j
+        i += 1
+    return spans
+
+
+def pattern_key(pattern, spans):
+    """
+    Get the index key of a pattern: ("prefix", text before the first wildcard), or if the pattern starts
+    with a wildcard ("suffix", text after the last wildcard). Patterns with wildcards at both ends get ("suffix", "").
+    :param spans: Wildcards of the pattern from wildcard_spans().
+    """
+    if spans[0][0] > 0:
+        return "prefix", pattern[:spans[0][0]]
+    return "suffix", pattern[spans[-1][1]:]
+
+
+def candidate_keys(user_mail):
+    """
+    Get the index keys of all patterns that could match a mail address, one per prefix and suffix of it.
+    """
+    for length in range(1, len(user_mail) + 1):
+        yield "prefix", user_mail[:length]
+    for length in range(len(user_mail) + 1):
+        yield "suffix", user_mail[len(user_mail) - length:]
+
+
+def parse_services(value):
+    """
+    Parse a comma-separated list of services into their column names.
+    :return: Set of service columns, e.g. {"github active"}, or {ALL_SERVICES}.
+    """
+    if value is None:
+        return set()
+    services = set()
+    for service in str(value).split(","):
+        service = service.strip().lower()
+        if not service:
+            continue
+        if service != ALL_SERVICES and not service.endswith(SERVICE_COLUMN_SUFFIX):
+            service += SERVICE_COLUMN_SUFFIX
+        services.add(service)
+    return services
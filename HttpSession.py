@@ -0,0 +1,133 @@
+import copy
+import logging
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+
+# status codes that are worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# methods that can safely be retried after a server error
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "PROPFIND"}
+
+
+class HttpSession:
+    def __init__(self, config=None, metrics=None):
+        """
+        Initialize a pooled HTTP session shared by the Nextcloud and Confluence classes.
+        :param config: Dictionary containing configuration parameters, settings are read from the optional "http" section.
+        :param metrics: Metrics instance to count retries in, or None.
+        """
+        http_config = (config or {}).get("http") or {}
+        self.timeout     = http_config.get("timeout", 30)
+        self.retries     = http_config.get("retries", 5)
+        self.backoff     = http_config.get("backoff", 1)
+        self.max_backoff = http_config.get("max_backoff", 60)
+        pool_size        = http_config.get("pool_size", 10)
+        max_per_host     = http_config.get("max_connections_per_host")
+
+        # keep-alive connection pool for all hosts, requests wait for a free connection if the number per host is limited
+        self.session = requests.Session()
+        if max_per_host:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max_per_host, pool_block=True)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # retried requests are counted in the metrics, if given
+        self.metrics = metrics
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying with exponential backoff on connection errors, 429 and 5xx responses.
+        :param method: HTTP method.
+        :param url: URL to send the request to.
+        :param kwargs: Passed on to requests.Session.request().
+        :return: The requests.Response of the last attempt.
+        """
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt or method not in IDEMPOTENT_METHODS:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logging.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s...")
+            else:
+                # only rate limiting is safe to retry for non-idempotent methods
+                retryable = response.status_code == 429 or (response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS)
+                if last_attempt or not retryable:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                logging.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s...")
+                response.close()
+
+            if self.metrics is not None:
+                self.metrics.add("http_retries")
+            time.sleep(delay)
+
+    def with_metrics(self, metrics):
+        """
+        Get a session sharing this session's connections, that counts its retries in other metrics, e.g. per job.
+        :param metrics: Metrics instance to count retries in, or None.
+        :return: A new HttpSession, closing either session closes the connections of both.
+        """
+        session = copy.copy(self)
+        session.metrics = metrics
+        return session
+
+    def get(self, url, **kwargs):
+        """
+        Send a GET request, see request().
+        """
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        """
+        Send a PUT request, see request().
+        """
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        Send a POST request, see request().
+        """
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        self.session.close()
+
+    def _backoff_delay(self, attempt):
+        """
+        Exponential backoff with a bit of jitter, capped at max_backoff.
+        """
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay + random.uniform(0, delay / 10)
+
+    def _retry_after(self, response):
+        """
+        Get the delay requested by the server in the Retry-After header, None if not given.
+        """
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0), self.max_backoff)
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# prefix of all exported Prometheus metrics
+METRIC_PREFIX = "stafflist"
+
+# label holding the name of the run, "job" is taken by Prometheus for the scrape job
+JOB_LABEL = "stafflist_job"
+
+# help texts of the exported values, values not listed here are exported without help text
+VALUE_HELP = {
+    "bytes_downloaded":   "Bytes downloaded from Nextcloud, 0 if the cached copy was used.",
+    "rows_parsed":        "Rows read from the Staff sheet.",
+    "invalid_values":     "Cells that could not be converted to their column's type.",
+    "snapshot_used":      "1 if the rows were loaded from a snapshot instead of parsing the spreadsheet.",
+    "rows_filtered":      "Staff members left out of the published list.",
+    "warnings":           "Warnings found by the checks.",
+    "expired_exceptions": "Exceptions whose expiry date has passed.",
+    "accounts_verified":  "Accounts of departed staff whose state was looked up in the service.",
+    "accounts_drifted":   "Verified accounts whose state differs from the spreadsheet.",
+    "new_warnings":       "Warnings that were not there in the previous run.",
+    "resolved_warnings":  "Warnings from the previous run that are gone.",
+    "http_retries":       "HTTP requests that were retried.",
+    "files_exported":     "Number of exported files that were written because their content changed.",
+    "page_updated":       "1 if the Confluence page was updated, 0 if it was already up to date.",
+    "pages_updated":      "Number of Confluence pages that were updated.",
+    "skipped":            "1 if the run was skipped because the spreadsheet had not changed.",
+    "success":            "1 if the run finished successfully.",
+}
+
+
+class Metrics:
+    def __init__(self, job="run", profile_dir=None):
+        """
+        Collect stage durations and counters for one run of a job.
+        :param job: Name of the job, used as a label on the exported metrics.
+        :param profile_dir: Directory to write CPU and memory profiles of each stage to, None to not profile.
+        """
+        self.job = job
+        self.started = time.time()
+        self.stages = {}
+        self.values = {"success": 0, "skipped": 0}
+        self.profiler = None
+        if profile_dir:
+            from Profiler import Profiler
+            self.profiler = Profiler(profile_dir, job)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a stage of the run, durations of repeated stages are added up.
+        The stage is also profiled if the Metrics were created with a profile_dir.
+        :param name: Name of the stage, e.g. "download" or "parse".
+        """
+        profiling = self.profiler.start(name) if self.profiler is not None else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0) + duration
+            logging.debug(f"Stage {name} took {duration:.3f}s")
+
+            # the profile report is written outside the timed part
+            if profiling is not None:
+                self.profiler.stop(profiling)
+
+    def set(self, name, value):
+        """
+        Set a value, booleans are stored as 0 or 1.
+        """
+        self.values[name] = int(value) if isinstance(value, bool) else value
+
+    def add(self, name, value=1):
+        """
+        Add to a counter.
+        """
+        self.values[name] = self.values.get(name, 0) + value
+
+    def to_dict(self):
+        """
+        Get all collected metrics as a dictionary.
+        """
+        return {
+            "job": self.job,
+            "started": round(self.started, 3),
+            "duration_seconds": round(time.time() - self.started, 4),
+            "stages": {name: round(duration, 4) for name, duration in self.stages.items()},
+            **self.values,
+        }
+
+    def write_json(self, path):
+        """
+        Append the metrics as a single JSON line to a file, "-" writes to stdout.
+        """
+        line = json.dumps(self.to_dict(), sort_keys=True)
+        if path == "-":
+            print(line, file=sys.stdout, flush=True)
+            return
+        with open(path, "a") as f:
+            f.write(line + "\n")
+
+    def samples(self):
+        """
+        Get the metrics as Prometheus samples.
+        :return: List of (metric name, help text, labels, value) tuples.
+        """
+        label = f'{JOB_LABEL}="{self.job}"'
+        samples = [
+            (f"{METRIC_PREFIX}_stage_duration_seconds", "Duration of each stage of the last run.", f'{label},stage="{name}"', f"{duration:.6f}")
+            for name, duration in self.stages.items()
+        ]
+        samples += [
+            (f"{METRIC_PREFIX}_duration_seconds", "Duration of the last run.", label, f"{time.time() - self.started:.6f}"),
+            (f"{METRIC_PREFIX}_last_run_timestamp_seconds", "Start time of the last run.", label, f"{self.started:.3f}"),
+        ]
+        for name, value in self.values.items():
+            if not isinstance(value, (int, float)):
+                continue
+            samples.append((f"{METRIC_PREFIX}_{name}", VALUE_HELP.get(name), label, value))
+        return samples
+
+    def write_prometheus(self, path):
+        """
+        Atomically write the metrics in the Prometheus text format, for the node exporter's textfile collector.
+        """
+        write_prometheus([self], path)
+
+    def write(self, json_path=None, prometheus_path=None):
+        """
+        Write the metrics to the requested outputs, errors are logged and not raised.
+        :param json_path: File to append a JSON line to, "-" for stdout, None to skip.
+        :param prometheus_path: Prometheus textfile to write, None to skip.
+        """
+        write_all([self], json_path, prometheus_path)
+
+
+def write_prometheus(all_metrics, path):
+    """
+    Atomically write the metrics of one or more jobs to a single Prometheus textfile.
+    """
+    families = {}
+    for metrics in all_metrics:
+        for name, help_text, labels, value in metrics.samples():
+            families.setdefault(name, (help_text, []))[1].append(f"{name}{{{labels}}} {value}")
+
+    lines = []
+    for name, (help_text, samples) in families.items():
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines += samples
+
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_file, path)
+
+
+def write_all(all_metrics, json_path=None, prometheus_path=None):
+    """
+    Write the metrics of one or more jobs to the requested outputs, errors are logged and not raised.
+    :param all_metrics: List of Metrics instances.
+    :param json_path: File to append one JSON line per job to, "-" for stdout, None to skip.
+    :param prometheus_path: Prometheus textfile to write, None to skip.
+    """
+    try:
+        if json_path:
+            for metrics in all_metrics:
+                metrics.write_json(json_path)
+        if prometheus_path:
+            write_prometheus(all_metrics, prometheus_path)
+    except OSError as e:
+        logging.error(f"Failed to write metrics: {e}")
@@ -1,58 +1,298 @@
 import logging
-import requests
+from HttpSession import HttpSession
+from SnapshotCache import SnapshotCache, DEFAULT_MAX_MB
 from requests.auth import HTTPBasicAuth
-from datetime import datetime
+from requests.exceptions import RequestException
 from email.utils import parsedate_to_datetime
-import pdb
+import hashlib
+import io
+import json
 import os
+import threading
+import spreadsheet
+import xml.etree.ElementTree as ElementTree
+from jobcontext import job_path
+
+# WebDAV request for only the properties that tell if the file has changed
+PROPFIND_BODY = """<?xml version="1.0"?>
+<d:propfind xmlns:d="DAV:"><d:prop><d:getetag/><d:getlastmodified/></d:prop></d:propfind>"""
+
+# default location of the local download cache
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'staff-list')
+
+# one lock per cache metadata file, jobs sharing a spreadsheet update the same file from several threads
+_meta_locks = {}
+_meta_locks_lock = threading.Lock()
 
 class Nextcloud:
 
-    def __init__(self, config, args): 
+    def __init__(self, config, args, session=None):
         """
         Initialize the Nextcloud class with self.configuration.
+        :param session: Shared HttpSession, a new one is created if None.
         """
         self.config = config
         self.args = args
+        self.session = session or HttpSession(config)
+        self.url = f"{self.config['nextcloud']['base_url']}/remote.php/dav/files/{self.config['nextcloud']['username']}/{self.config['nextcloud']['remote_file_path']}"
+
+        # local download cache, keyed on the remote url
+        self.cache_dir = self.config['nextcloud'].get('cache_dir', DEFAULT_CACHE_DIR)
+        cache_key = hashlib.sha1(self.url.encode('utf-8')).hexdigest()
+        self.cache_file = os.path.join(self.cache_dir, f"{cache_key}.xlsx")
+        self.cache_meta_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        with _meta_locks_lock:
+            self.meta_lock = _meta_locks.setdefault(os.path.abspath(self.cache_meta_file), threading.Lock())
+        self.snapshots = SnapshotCache(os.path.join(self.cache_dir, 'snapshots'), self.config['nextcloud'].get('snapshot_max_mb', DEFAULT_MAX_MB))
+
+        # filled in by download_spreadsheet()
+        self.etag = None
+        self.last_modified = None
+        self.not_modified = False
+        self.content = None
+        self.bytes_downloaded = 0
+        self.snapshot_used = False
 
 
     def download_spreadsheet(self):
         """
         Download a spreadsheet from a given URL using basic authentication.
+        If a cached copy exists, the download is conditional and a 304 reply reuses the cached file.
+        The spreadsheet is kept in memory and only written to args.file if args.keep is set.
+        :return: True if the spreadsheet was downloaded, False otherwise.
         """
 
         logging.debug("Starting download_spreadsheet function...")
 
+        # send the validators of the cached copy, if there is one
+        meta = self._read_cache_meta()
+        headers = {}
+        if meta and os.path.exists(self.cache_file):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
         # Download the spreadsheet
         logging.info("Downloading spreadsheet...")
-        logging.debug(f"Using URL: {self.config['nextcloud']['base_url']}/remote.php/dav/files/{self.config['nextcloud']['username']}/{self.config['nextcloud']['remote_file_path']}")
-        response = requests.get(f"{self.config['nextcloud']['base_url']}/remote.php/dav/files/{self.config['nextcloud']['username']}/{self.config['nextcloud']['remote_file_path']}", auth=HTTPBasicAuth(self.config['nextcloud']['username'], self.config['nextcloud']['password']))
-
-        # Extract the last-modified date from headers
-        last_modified_header = response.headers.get('Last-Modified')
+        logging.debug(f"Using URL: {self.url}")
+        try:
+            response = self.session.get(self.url, headers=headers, auth=HTTPBasicAuth(self.config['nextcloud']['username'], self.config['nextcloud']['password']))
+        except RequestException as e:
+            logging.error(f"Failed to download the spreadsheet: {e}")
+            return False
 
-        if last_modified_header:
-            # Parse the HTTP date format
-            last_modified_dt = parsedate_to_datetime(last_modified_header)
-            # Convert to timestamp
-            modification_time = last_modified_dt.timestamp()
-        else:
-            modification_time = None
+        # nothing changed since the cached copy was downloaded
+        if response.status_code == 304:
+            logging.info("Spreadsheet not modified since last download, using cached copy.")
+            self.not_modified = True
+            self.bytes_downloaded = 0
+            self.etag = meta.get('etag')
+            self.last_modified = meta.get('last_modified')
+            with open(self.cache_file, 'rb') as f:
+                self.content = f.read()
 
         # Check if the request was successful
-        if response.status_code == 200:
-            with open(self.args.file, 'wb') as f:
-                f.write(response.content)
+        elif response.status_code == 200:
+            self.not_modified = False
+            self.content = response.content
+            self.bytes_downloaded = len(self.content)
             logging.info("Spreadsheet downloaded successfully.")
+
+            # Extract the validators from headers
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+
+            # store the new copy in the cache
+            self._update_cache(self.content)
         else:
-            logging.error("Failed to download the spreadsheet.")
+            logging.error(f"Failed to download the spreadsheet: HTTP {response.status_code}")
             return False
 
+        # only write the spreadsheet to disk if asked to keep it
+        if self.args.keep:
+            self.save(job_path(self.config, self.args.file))
+
+        return True
+
+
+    def remote_version(self):
+        """
+        Get the version of the remote file without downloading it, with a WebDAV PROPFIND request
+        or a HEAD request if the server does not support PROPFIND.
+        :return: The ETag, or the last-modified time if there is no ETag. None if the request failed.
+        """
+        auth = HTTPBasicAuth(self.config['nextcloud']['username'], self.config['nextcloud']['password'])
+        try:
+            response = self.session.request('PROPFIND', self.url, data=PROPFIND_BODY, headers={'Depth': '0', 'Content-Type': 'application/xml'}, auth=auth)
+            if response.status_code == 207:
+                tree = ElementTree.fromstring(response.content)
+                etag = tree.findtext('.//{DAV:}getetag')
+                last_modified = tree.findtext('.//{DAV:}getlastmodified')
+                if etag or last_modified:
+                    return etag or last_modified
+
+            # fall back to the headers of a HEAD request
+            response = self.session.request('HEAD', self.url, auth=auth)
+            if response.status_code == 200:
+                return response.headers.get('ETag') or response.headers.get('Last-Modified')
+            logging.error(f"Failed to get the version of the spreadsheet: HTTP {response.status_code}")
+        except (RequestException, ElementTree.ParseError) as e:
+            logging.error(f"Failed to get the version of the spreadsheet: {e}")
+        return None
+
+
+    def get_spreadsheet(self):
+        """
+        Get the downloaded spreadsheet as an in-memory file object.
+        :return: A file object that can be passed directly to openpyxl.
+        """
+        return io.BytesIO(self.content)
+
+
+    def read_sheets(self, sheets):
+        """
+        Get the parsed rows of the downloaded spreadsheet, from a snapshot if this version has been parsed before.
+        :param sheets: Sequence of (sheet name, stop_at_blank) pairs, see spreadsheet.read_sheets().
+        :return: List with a (header mapping, list of rows) tuple per sheet.
+        """
+        sheets = tuple(tuple(sheet) for sheet in sheets)
+        data = self.snapshots.load(self.url, self.version, sheets)
+        self.snapshot_used = data is not None
+        if self.snapshot_used:
+            logging.info("Using parsed snapshot of the spreadsheet.")
+            return data
+
+        data = spreadsheet.read_sheets(self.get_spreadsheet(), sheets)
+        self.snapshots.save(self.url, self.version, sheets, data)
+        return data
+
+
+    def save(self, path):
+        """
+        Atomically write the downloaded spreadsheet to a file.
+        :param path: Path to write the spreadsheet to.
+        """
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(self.content)
+
         # Set the file's modification time to match the server's last-modified time
-        if modification_time:
-            os.utime(self.args.file, (modification_time, modification_time))
+        self._set_modification_time(tmp_file)
+        os.replace(tmp_file, path)
+        logging.info(f"Saved spreadsheet to {path}")
+
+
+    def is_processed(self, job):
+        """
+        Check if the currently downloaded version has already been handled by a job.
+        :param job: Name of the job, e.g. "publish" or "check".
+        :return: True if the job has already processed this version of the spreadsheet.
+        """
+        meta = self._read_cache_meta()
+        if not meta or not self.not_modified:
+            return False
+        return meta.get('processed', {}).get(job) == self.version
+
+
+    def cached_version_processed(self, job):
+        """
+        Check before downloading if a job has already handled the cached copy, the download may then find nothing to do.
+        :param job: Name of the job, e.g. "publish" or "check".
+        :return: True if the job has processed the version of the spreadsheet in the cache.
+        """
+        meta = self._read_cache_meta()
+        if not meta or not os.path.exists(self.cache_file):
+            return False
+        version = meta.get('etag') or meta.get('last_modified')
+        return version is not None and meta.get('processed', {}).get(job) == version
+
+
+    def mark_processed(self, job):
+        """
+        Record that a job has handled the currently downloaded version of the spreadsheet.
+        :param job: Name of the job, e.g. "publish" or "check".
+        """
+        with self.meta_lock:
+            meta = self._read_cache_meta()
+            if not meta or self.version is None:
+                return
+            meta.setdefault('processed', {})[job] = self.version
+            self._write_cache_meta(meta)
+
+
+    @property
+    def modification_time(self):
+        """
+        The server's last-modified time as a local datetime, None if unknown.
+        """
+        if not self.last_modified:
+            return None
+        return parsedate_to_datetime(self.last_modified).astimezone().replace(tzinfo=None)
+
+
+    @property
+    def version(self):
+        """
+        Identifier of the downloaded version, the ETag if the server sent one.
+        """
+        return self.etag or self.last_modified
+
+
+    def _set_modification_time(self, path):
+        """
+        Set the file's modification time to the server's last-modified time.
+        """
+        if self.last_modified:
+            # Parse the HTTP date format
+            last_modified_dt = parsedate_to_datetime(self.last_modified)
+            # Convert to timestamp
+            modification_time = last_modified_dt.timestamp()
+            os.utime(path, (modification_time, modification_time))
             logging.debug(f"Set file modification time to {last_modified_dt.isoformat()}")
         else:
             logging.debug("No Last-Modified header found; file modification time not set.")
 
-        return True
+
+    def _read_cache_meta(self):
+        """
+        Read the metadata of the cached copy, None if there is no usable cache.
+        """
+        try:
+            with open(self.cache_meta_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+    def _write_cache_meta(self, meta):
+        """
+        Write the metadata of the cached copy, call it holding meta_lock.
+        """
+        tmp_file = f"{self.cache_meta_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, self.cache_meta_file)
+
+
+    def _update_cache(self, content):
+        """
+        Store a freshly downloaded copy and its validators in the cache.
+        """
+        if not self.etag and not self.last_modified:
+            logging.debug("No ETag or Last-Modified header found; not caching the spreadsheet.")
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self.meta_lock:
+                tmp_file = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_file, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_file, self.cache_file)
+
+                # the markers of other jobs are kept, they only match the version they were recorded for
+                processed = (self._read_cache_meta() or {}).get('processed', {})
+                self._write_cache_meta({'etag': self.etag, 'last_modified': self.last_modified, 'processed': processed})
+            logging.debug(f"Cached spreadsheet at {self.cache_file}")
+        except OSError as e:
+            logging.warning(f"Failed to cache the spreadsheet: {e}")
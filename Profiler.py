@@ -0,0 +1,103 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import tracemalloc
+
+# number of functions and allocation sites listed in the reports
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+# frames kept per allocation, more frames make tracing a lot slower
+TRACEMALLOC_FRAMES = 1
+
+
+class Profiler:
+    def __init__(self, directory, job="run"):
+        """
+        Profile the stages of a run with cProfile and tracemalloc, and write a report per stage.
+        For each stage <job>.<stage>.prof holds the cProfile data, e.g. for snakeviz, and
+        <job>.<stage>.txt the hotspots and the largest allocations.
+        Memory is traced for the whole process, so only one job should be profiled at a time.
+        :param directory: Directory to write the reports to, it is created if needed.
+        :param job: Name of the job, used in the report file names.
+        """
+        self.directory = directory
+        self.job = re.sub(r'[^\w.-]', '_', job)
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.active = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def start(self, name):
+        """
+        Start profiling a stage. Stages nested in a stage that is already profiled in the same thread
+        are part of the outer report.
+        :param name: Name of the stage, e.g. "download" or "parse".
+        :return: Handle to pass to stop(), None if the stage is not profiled on its own.
+        """
+        if getattr(self.active, 'stage', None):
+            return None
+        self.active.stage = name
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        profile.enable()
+        return name, profile, start_memory
+
+    def stop(self, handle):
+        """
+        Stop profiling a stage and write its report. Call this after the stage has been timed,
+        the report takes much longer than the profiling itself.
+        :param handle: Handle from start().
+        """
+        if handle is None:
+            return
+        name, profile, start_memory = handle
+        profile.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        self.active.stage = None
+
+        # one snapshot of what the stage left allocated, after the measurements above
+        snapshot = tracemalloc.take_snapshot()
+        self.write_report(name, profile, peak - start_memory, current - start_memory, snapshot.statistics('lineno'))
+
+    def write_report(self, name, profile, peak, growth, allocations):
+        """
+        Write the reports of a stage, repeated stages get a numbered suffix.
+        :param name: Name of the stage.
+        :param profile: The stage's cProfile.Profile.
+        :param peak: Peak memory use during the stage in bytes, above the use at its start.
+        :param growth: Memory use at the end of the stage in bytes, above the use at its start.
+        :param allocations: tracemalloc statistics of the memory allocated at the end of the stage.
+        """
+        with self.lock:
+            count = self.counts.get(name, 0) + 1
+            self.counts[name] = count
+        base = os.path.join(self.directory, f"{self.job}.{name}" + (f".{count}" if count > 1 else ""))
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stream.write(f"Stage {name} of {self.job}\n")
+        stream.write(f"Peak memory: {peak / 1024 / 1024:.2f} MB above the start of the stage\n")
+        stream.write(f"Memory at the end: {growth / 1024 / 1024:.2f} MB above the start of the stage\n\n")
+        stream.write("Largest allocations held at the end of the stage:\n")
+        for stat in allocations[:TOP_ALLOCATIONS]:
+            stream.write(f"  {stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback[0]}\n")
+        stream.write("\nHotspots by cumulative time:\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        stream.write("Hotspots by own time:\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+
+        try:
+            stats.dump_stats(f"{base}.prof")
+            with open(f"{base}.txt", 'w') as f:
+                f.write(stream.getvalue())
+            logging.info(f"Profile of stage {name} written to {base}.txt")
+        except OSError as e:
+            logging.warning(f"Failed to write the profile of stage {name}: {e}")
@@ -0,0 +1,102 @@
+import logging
+from datetime import date, datetime
+from html import escape
+
+# columns shown on the page if none are configured
+DEFAULT_COLUMNS = [
+    {"header": "name",       "title": "Name"},
+    {"header": "unit/team",  "title": "Unit"},
+    {"header": "university", "title": "Organization"},
+    {"header": "role",       "title": "Role"},
+]
+
+# text shown above the table
+INTRO = """
+    <p>This list is generated daily from the central <a href="https://nextcloud.dc.scilifelab.se/apps/onlyoffice/3113254?filePath=%2FNBIS%20TechOps%20Staff%20list%2Fnbis_staff.xlsx">master staff list in Data Center's NextCloud instance</a>.</p>
+
+    <p>Master staff list updated:&nbsp;&nbsp;&nbsp;{modified}
+This page rendered on:&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;{rendered}</p>
+"""
+
+
+class Renderer:
+    def __init__(self, config, columns=None):
+        """
+        Initialize the Renderer class with self.configuration.
+        :param config: Dictionary containing configuration parameters, the columns are read from confluence.columns.
+        :param columns: List of (header, title) tuples from parse_columns(), to render other columns than the configured ones.
+        """
+        self.columns = columns or parse_columns(config.get("confluence", {}).get("columns") or DEFAULT_COLUMNS)
+        logging.debug(f"Rendering columns: {self.columns}")
+
+    def render(self, staff_list, modified):
+        """
+        Render the staff list as a page in Confluence storage format.
+        :param staff_list: Iterable of staff member dictionaries keyed by lowercased header.
+        :param modified: Datetime when the master staff list was last modified.
+        :return: The page content as a string.
+        """
+        parts = [self.render_intro(modified), self.render_table_header()]
+        parts.extend(self.render_row(staff_member) for staff_member in staff_list)
+        parts.append(self.render_table_footer())
+        return "".join(parts)
+
+    def render_intro(self, modified):
+        """
+        Render the text above the table.
+        :param modified: Datetime when the master staff list was last modified.
+        """
+        return INTRO.format(modified=modified.strftime("%Y-%m-%d %H:%M"), rendered=datetime.now().strftime("%Y-%m-%d %H:%M"))
+
+    def render_table_header(self):
+        """
+        Render the start of the table with its header row.
+        """
+        parts = ["\n    <table>\n        <tr>\n"]
+        for header, title in self.columns:
+            parts.append(f"            <th><strong>{escape(title)}</strong></th>\n")
+        parts.append("        </tr>\n")
+        return "".join(parts)
+
+    def render_row(self, staff_member):
+        """
+        Render the table row of a staff member.
+        """
+        parts = ["        <tr>\n"]
+        for header, title in self.columns:
+            parts.append(f"            <td>{format_cell(staff_member.get(header))}</td>\n")
+        parts.append("        </tr>\n")
+        return "".join(parts)
+
+    def render_table_footer(self):
+        """
+        Render the end of the table.
+        """
+        return "    </table>"
+
+
+def parse_columns(columns):
+    """
+    Parse the configured columns into a list of (header, title) tuples.
+    :param columns: List of header names or dictionaries with "header" and optionally "title".
+    """
+    parsed = []
+    for column in columns:
+        if isinstance(column, str):
+            column = {"header": column}
+        header = str(column["header"]).strip().lower()
+        parsed.append((header, str(column.get("title", header.capitalize()))))
+    return parsed
+
+
+def format_cell(value):
+    """
+    Format a cell value as escaped text.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    return escape(str(value))
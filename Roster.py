@@ -0,0 +1,152 @@
+from datetime import date, datetime
+
+# columns the roster is indexed on when it is built, other columns are indexed when first grouped on
+NAME_COLUMN = "name"
+END_COLUMN = "employment end"
+INDEXED_COLUMNS = ("unit/team", "university")
+
+
+class Member:
+    __slots__ = ("row", "columns", "active")
+
+    def __init__(self, row, columns, active=True):
+        """
+        A staff member, a read-only view of a typed row keyed by lowercased header.
+        Empty cells read as empty strings.
+        :param row: Typed row of the Staff sheet from Schema.normalize().
+        :param columns: Header mapping of the Staff sheet, shared by all members.
+        :param active: False if the employment of the staff member has ended.
+        """
+        self.row = row
+        self.columns = columns
+        self.active = active
+
+    def __getitem__(self, header):
+        value = self.row[self.columns[header]]
+        return "" if value is None else value
+
+    def __contains__(self, header):
+        return header in self.columns
+
+    def get(self, header, default=None):
+        if header not in self.columns:
+            return default
+        return self[header]
+
+    def keys(self):
+        return self.columns.keys()
+
+    def items(self):
+        return [(header, self[header]) for header in self.columns]
+
+    def __repr__(self):
+        return f"Member({dict(self.items())!r})"
+
+
+class Roster:
+    def __init__(self, header_mapping, rows, today=None):
+        """
+        The staff members of the Staff sheet, sorted by name and indexed by unit/team, organisation and
+        active status, so the sorted, filtered and grouped views do not need another pass over the rows.
+        :param header_mapping: Header mapping of the Staff sheet from spreadsheet.read_sheet().
+        :param rows: Typed rows of the Staff sheet from Schema.normalize().
+        :param today: Date employment end dates are compared to, defaults to today.
+        """
+        self.columns = header_mapping
+        today = today or date.today()
+        name_index = header_mapping.get(NAME_COLUMN)
+        end_index = header_mapping.get(END_COLUMN)
+
+        # one member per row, sorted by name with the row order kept for equal names
+        members = [Member(row, header_mapping, end_index is None or not _has_ended(row[end_index], today)) for row in rows]
+        if name_index is not None:
+            members.sort(key=lambda member: _sort_key(member.row[name_index]))
+        self.members = tuple(members)
+
+        # index everything in one pass over the sorted members
+        indexed = [(header, header_mapping[header], {}, {}) for header in INDEXED_COLUMNS if header in header_mapping]
+        active = []
+        self.by_name = {}
+        for member in self.members:
+            if member.active:
+                active.append(member)
+            if name_index is not None:
+                self.by_name.setdefault(member[NAME_COLUMN], []).append(member)
+            for header, index, everyone, active_groups in indexed:
+                _add_to_group(everyone, active_groups, member.row[index], member)
+
+        # staff members whose end date has not passed, end dates that could not be parsed are kept
+        self.active = tuple(active)
+        self.ended = len(self.members) - len(self.active)
+        self.groups = {header: (_freeze(everyone), _freeze(active_groups)) for header, _, everyone, active_groups in indexed}
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def current(self):
+        """
+        Get the staff members whose employment has not ended, sorted by name.
+        """
+        return self.active
+
+    def find(self, name):
+        """
+        Get the staff members with a name.
+        :return: List of members, empty if there is nobody with that name.
+        """
+        return self.by_name.get(name, [])
+
+    def group_by(self, header, active_only=True):
+        """
+        Group the staff members by the value of a column, members without a value are left out.
+        :param header: Lowercased header of the column, e.g. "unit/team".
+        :param active_only: If True, only staff members whose employment has not ended.
+        :return: Dictionary of the trimmed value to a tuple of members sorted by name.
+        """
+        if header not in self.groups:
+            if header not in self.columns:
+                return {}
+            self._index(header)
+        return self.groups[header][1 if active_only else 0]
+
+    def _index(self, header):
+        """
+        Index a column that is not indexed when the roster is built.
+        """
+        index = self.columns[header]
+        everyone = {}
+        active = {}
+        for member in self.members:
+            _add_to_group(everyone, active, member.row[index], member)
+        self.groups[header] = (_freeze(everyone), _freeze(active))
+
+
+def _add_to_group(everyone, active, value, member):
+    """
+    Add a member to the groups of its value, members without a value are not grouped.
+    """
+    if value:
+        key = str(value).strip()
+        everyone.setdefault(key, []).append(member)
+        if member.active:
+            active.setdefault(key, []).append(member)
+
+
+def _freeze(groups):
+    return {key: tuple(members) for key, members in groups.items()}
+
+
+def _sort_key(value):
+    return "" if value is None else str(value)
+
+
+def _has_ended(end, today):
+    """
+    Check if an employment end date has passed, values that are not dates never have.
+    """
+    if isinstance(end, datetime):
+        end = end.date()
+    return isinstance(end, date) and end < today
@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime, timedelta
+from ExceptionIndex import ALL_SERVICES
+
+# employment grace period in days
+EMPLOYMENT_GRACE_PERIOD_DAYS = 90
+
+# columns named "<service> active" are checked for every departed employee
+SERVICE_COLUMN_SUFFIX = " active"
+
+
+class RuleEngine:
+    def __init__(self, config, header_mapping, now=None):
+        """
+        Compile the checks for a sheet once, so rows can be evaluated in a single pass.
+        :param config: Dictionary containing configuration parameters, the rules are read from the optional "checks" section.
+        :param header_mapping: Header mapping of the Staff sheet from spreadsheet.read_sheet().
+        :param now: Datetime to calculate the grace period from, defaults to now.
+        """
+        checks_config = config.get("checks") or {}
+        self.grace_period_days = checks_config.get("grace_period_days", EMPLOYMENT_GRACE_PERIOD_DAYS)
+        self.cutoff = (now or datetime.now()) - timedelta(days=self.grace_period_days)
+
+        self.mail_index = header_mapping["nbis mail"]
+        self.end_index = header_mapping["employment end"]
+
+        # one rule per service column, either the configured services or all "<service> active" columns
+        services = checks_config.get("services")
+        if services is None:
+            services = [header[:-len(SERVICE_COLUMN_SUFFIX)] for header in header_mapping if header.endswith(SERVICE_COLUMN_SUFFIX)]
+        ignored = {str(service).lower() for service in checks_config.get("ignore_services") or []}
+
+        self.rules = []
+        for service in services:
+            service = str(service).strip().lower()
+            if service in ignored:
+                continue
+            column = f"{service}{SERVICE_COLUMN_SUFFIX}"
+            if column not in header_mapping:
+                logging.warning(f"No column named '{column}' in the spreadsheet, not checking {service}.")
+                continue
+            self.rules.append((column, header_mapping[column]))
+        logging.debug(f"Checking services: {[column for column, _ in self.rules]}, cutoff {self.cutoff.date()}")
+
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+        # number of rows evaluated, for reporting
+        self.rows_checked = 0
+
+    def evaluate(self, rows, exceptions):
+        """
+        Evaluate all rules on the rows of the Staff sheet.
+        :param rows: Typed rows of the Staff sheet from Schema.normalize().
+        :param exceptions: ExceptionIndex of the services users are allowed to keep active.
+        :return: Dictionary of user mail to the set of warnings for that user.
+        """
+        warnings = {}
+        for row in rows:
+            self.rows_checked += 1
+            user_warnings = self.evaluate_row(row, exceptions)
+            if user_warnings:
+                warnings[row[self.mail_index]] = user_warnings
+        return warnings
+
+    def evaluate_state(self, rows, exceptions):
+        """
+        Evaluate all rules on the rows of the Staff sheet, and collect the warnings per row to compare with the
+        previous run. Every row is evaluated, that is cheaper than finding out which rows have changed.
+        :param rows: Typed rows of the Staff sheet from Schema.normalize().
+        :param exceptions: ExceptionIndex of the services users are allowed to keep active.
+        :return: Tuple of the warnings dictionary, as from evaluate(), and the state to save for the next run.
+        """
+        warnings = {}
+        state = {}
+        for row in rows:
+            self.rows_checked += 1
+            user_mail = row[self.mail_index]
+            user_warnings = self.evaluate_row(row, exceptions)
+
+            # only the warnings are compared between runs, the rows are not hashed
+            state[str(user_mail if user_mail is not None else row[0])] = ("", user_warnings)
+            if user_warnings:
+                warnings[user_mail] = user_warnings
+        return warnings, state
+
+    def evaluate_row(self, row, exceptions):
+        """
+        Evaluate all rules on a single row of the Staff sheet.
+        :param row: Typed row of the Staff sheet from Schema.normalize().
+        :param exceptions: ExceptionIndex of the services users are allowed to keep active.
+        :return: Set of warnings for the row, empty if there are none.
+        """
+
+        # only employees terminated more than the grace period ago are checked
+        if not self.is_departed(row):
+            return set()
+
+        active_services = [column for column, index in self.rules if row[index] is True]
+        if not active_services:
+            return set()
+
+        user_mail = row[self.mail_index]
+        user_exceptions = exceptions.lookup(user_mail)
+        if self.debug:
+            logging.debug(f"User {user_mail} still active in: {active_services}, exceptions: {user_exceptions}")
+        if ALL_SERVICES in user_exceptions:
+            return set()
+        return {column for column in active_services if column not in user_exceptions}
+
+    def is_departed(self, row):
+        """
+        Check if the employment of a row ended more than the grace period ago.
+        """
+        employment_end = row[self.end_index]
+        return employment_end is not None and employment_end < self.cutoff
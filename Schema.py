@@ -0,0 +1,166 @@
+import logging
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+# columns holding dates, parsed into datetimes
+DATE_COLUMNS = ("employment start", "employment end")
+
+# columns holding mail addresses, trimmed and lowercased
+EMAIL_COLUMNS = ("nbis mail",)
+
+# columns named "<service> active" hold yes/no values, parsed into booleans
+BOOL_COLUMN_SUFFIX = " active"
+
+# formats tried in order for dates written as text, the spreadsheet should use the first one
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d", "%Y%m%d", "%d.%m.%Y")
+
+TRUE_VALUES = frozenset(("yes", "y", "true", "1", "x"))
+FALSE_VALUES = frozenset(("no", "n", "false", "0", "-"))
+
+# day zero of spreadsheet serial dates
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+class Schema:
+    def __init__(self, header_mapping):
+        """
+        Pick a converter for each column of a sheet, so every cell is converted once into a typed value.
+        Dates become datetimes, yes/no columns booleans, mail addresses are lowercased and text is trimmed.
+        Empty cells become None.
+        :param header_mapping: Header mapping of the Staff sheet from spreadsheet.read_sheet().
+        """
+        self.header_mapping = header_mapping
+        width = max(header_mapping.values(), default=-1) + 1
+        self.converters = [(None, parse_text)] * width
+        for header, index in header_mapping.items():
+            if header in DATE_COLUMNS:
+                self.converters[index] = (header, parse_date)
+            elif header in EMAIL_COLUMNS:
+                self.converters[index] = (header, parse_email)
+            elif header.endswith(BOOL_COLUMN_SUFFIX):
+                self.converters[index] = (header, parse_bool)
+            else:
+                self.converters[index] = (header, parse_text)
+
+    def normalize(self, rows):
+        """
+        Convert the rows of a sheet into typed rows.
+        :param rows: Rows from spreadsheet.read_sheet().
+        :return: Tuple of (list of typed rows, validation report). The typed rows have the same columns
+                 as the input rows, the report lists (row number, header, value, problem) tuples for the
+                 cells that could not be converted, see invalid_value() for what they are set to.
+        """
+        typed_rows = []
+        problems = []
+        converters = self.converters
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                typed_rows.append(tuple(convert(value) for (_, convert), value in zip(converters, row)))
+            except ValueError:
+                # convert the cells one by one to find out which of them are invalid
+                typed_row = []
+                for (header, convert), value in zip(converters, row):
+                    try:
+                        typed_row.append(convert(value))
+                    except ValueError as e:
+                        problems.append((row_number, header, value, str(e)))
+                        typed_row.append(invalid_value(convert, value))
+                typed_rows.append(tuple(typed_row))
+        return typed_rows, problems
+
+
+def report_problems(problems):
+    """
+    Log the validation report from Schema.normalize().
+    """
+    for row_number, header, value, problem in problems:
+        logging.warning(f"Row {row_number}, column '{header}': {problem} ('{value}'), please fix it in the spreadsheet.")
+
+
+def invalid_value(convert, value):
+    """
+    Value to use for a cell that could not be converted. Invalid dates are treated as empty,
+    invalid yes/no values as no, and invalid mail addresses are kept as they are.
+    """
+    if convert is parse_bool:
+        return False
+    if convert is parse_email:
+        return str(value).strip()
+    return None
+
+
+def parse_text(value):
+    """
+    Trim text cells, empty cells become None.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def parse_email(value):
+    """
+    Trim and lowercase a mail address, empty cells become None.
+    """
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    if not value:
+        return None
+    if "@" not in value:
+        raise ValueError("not a mail address")
+    return value
+
+
+def parse_bool(value):
+    """
+    Convert a yes/no cell to a boolean, empty cells become None.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError("not yes or no")
+
+
+def parse_date(value):
+    """
+    Convert a date cell to a datetime, empty cells become None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return EXCEL_EPOCH + timedelta(days=value)
+        except OverflowError:
+            raise ValueError("not a date (should be YYYY-MM-DD)")
+    text = str(value).strip()
+    if not text:
+        return None
+    parsed = _parse_date_text(text)
+    if parsed is None:
+        raise ValueError("not a date (should be YYYY-MM-DD)")
+    return parsed
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(text):
+    """
+    Parse a date written as text, memoized as the same dates are repeated throughout the sheet.
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+
+# bump when the parsed rows change shape, so old snapshots are not used
+SCHEMA_VERSION = 2
+
+# cell values that JSON has no type for are stored as {"$": type, "v": value}
+DATE_TYPES = {"datetime": datetime, "date": date, "time": time}
+
+# default upper bound on the total size of the stored snapshots
+DEFAULT_MAX_MB = 200
+
+
+class SnapshotCache:
+    def __init__(self, cache_dir, max_mb=DEFAULT_MAX_MB):
+        """
+        On-disk cache of parsed spreadsheet sheets, so an unchanged spreadsheet is not parsed again.
+        Snapshots are keyed on the source, its version and SCHEMA_VERSION, the oldest are removed
+        when the total size goes over max_mb. They are stored as JSON, so a snapshot written by
+        someone else sharing the cache directory can at worst give wrong rows, never run code.
+        :param cache_dir: Directory to store the snapshots in.
+        :param max_mb: Upper bound on the total size of the snapshots in MB, 0 disables the cache.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def load(self, source, version, sheets):
+        """
+        Load the parsed sheets of a version of a spreadsheet.
+        :param source: Identifier of the spreadsheet, e.g. its url.
+        :param version: Version of the spreadsheet, e.g. its ETag. Nothing is cached if None.
+        :param sheets: Sheet specification the rows were parsed with.
+        :return: The parsed sheets, or None if there is no usable snapshot.
+        """
+        path = self._path(source, version, sheets)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = decode(json.load(f, object_hook=_decode_value))
+        except Exception as e:
+            logging.warning(f"Removing unreadable snapshot {path}: {e}")
+            self._remove(path)
+            return None
+
+        # mark as recently used, pruning removes the least recently used snapshots first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logging.debug(f"Loaded snapshot {path}")
+        return data
+
+    def save(self, source, version, sheets, data):
+        """
+        Store the parsed sheets of a version of a spreadsheet and remove the snapshots of its older versions.
+        :param source: Identifier of the spreadsheet, e.g. its url.
+        :param version: Version of the spreadsheet, e.g. its ETag. Nothing is cached if None.
+        :param sheets: Sheet specification the rows were parsed with.
+        :param data: The parsed sheets.
+        """
+        path = self._path(source, version, sheets)
+        if path is None:
+            return
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(encode(data), f, default=_encode_value, separators=(',', ':'))
+            os.replace(tmp_file, path)
+            logging.debug(f"Saved snapshot {path}")
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Failed to save snapshot: {e}")
+            self._remove(tmp_file)
+            return
+        self._prune(path)
+
+    def _path(self, source, version, sheets):
+        """
+        Path of a snapshot, named <source>.<version>.<sheets>.json so old versions of a source can be found.
+        """
+        if not self.max_bytes or version is None:
+            return None
+        source_key = _digest(source)
+        version_key = _digest(f"{version}\0{SCHEMA_VERSION}")
+        sheets_key = _digest(repr(sheets))
+        return os.path.join(self.cache_dir, f"{source_key}.{version_key}.{sheets_key}.json")
+
+    def _prune(self, current):
+        """
+        Remove the snapshots of other versions of the same source, then the least recently used
+        snapshots until the total size is below the bound.
+        """
+        source_key, version_key = os.path.basename(current).split('.')[:2]
+        snapshots = []
+        for entry in os.scandir(self.cache_dir):
+            # snapshots from before they were stored as JSON are never loaded again
+            if entry.name.endswith('.pickle'):
+                self._remove(entry.path)
+                continue
+            if not entry.name.endswith('.json') or entry.path == current:
+                continue
+            name_source, name_version = entry.name.split('.')[:2]
+            if name_source == source_key and name_version != version_key:
+                self._remove(entry.path)
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            snapshots.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # the snapshot that was just saved is always kept
+        total = sum(size for _, size, _ in snapshots) + os.path.getsize(current)
+        for _, size, path in sorted(snapshots):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            logging.debug(f"Removed snapshot {path}")
+        except OSError:
+            pass
+
+
+def encode(data):
+    """
+    Convert parsed sheets to JSON types, the header mappings become lists of pairs so every JSON object
+    in a snapshot is an encoded cell value.
+    :param data: List with a (header mapping, list of rows) tuple per sheet.
+    """
+    return [[list(header_mapping.items()), rows] for header_mapping, rows in data]
+
+
+def decode(data):
+    """
+    Convert a loaded snapshot back to the parsed sheets, as from encode().
+    :return: List with a (header mapping, list of row tuples) tuple per sheet.
+    """
+    return [({key: index for key, index in header_mapping}, [tuple(row) for row in rows]) for header_mapping, rows in data]
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return {"$": type(value).__name__, "v": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"$": "timedelta", "v": [value.days, value.seconds, value.microseconds]}
+    raise TypeError(f"cannot store {type(value).__name__} values")
+
+
+def _decode_value(obj):
+    if obj["$"] == "timedelta":
+        return timedelta(*obj["v"])
+    return DATE_TYPES[obj["$"]].fromisoformat(obj["v"])
+
+
+def _digest(value):
+    return hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:16]
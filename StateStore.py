@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import sqlite3
+
+# most rows have no warnings, they are stored and loaded without going through json
+NO_WARNINGS = "[]"
+
+
+class StateStore:
+    def __init__(self, path):
+        """
+        Open the local state store, creating it if needed.
+        :param path: Path to the SQLite database file.
+        """
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS rows (
+                job      TEXT NOT NULL,
+                key      TEXT NOT NULL,
+                hash     TEXT NOT NULL,
+                warnings TEXT NOT NULL,
+                PRIMARY KEY (job, key)
+            )""")
+        self.db.commit()
+        logging.debug(f"Opened state store {path}")
+
+    def load(self, job):
+        """
+        Load the state saved by the previous run of a job.
+        :param job: Name of the job, e.g. "publish" or "check".
+        :return: Dictionary of row key to a (hash, set of warnings) tuple, the hash is empty for rows that are not hashed.
+        """
+        cursor = self.db.execute("SELECT key, hash, warnings FROM rows WHERE job = ?", (job,))
+        return {key: (row_hash, set(json.loads(warnings)) if warnings != NO_WARNINGS else set()) for key, row_hash, warnings in cursor}
+
+    def save(self, job, state):
+        """
+        Replace the saved state of a job.
+        :param job: Name of the job, e.g. "publish" or "check".
+        :param state: Dictionary of row key to a (hash, set of warnings) tuple, the hash is empty for rows that are not hashed.
+        """
+        with self.db:
+            self.db.execute("DELETE FROM rows WHERE job = ?", (job,))
+            self.db.executemany(
+                "INSERT INTO rows (job, key, hash, warnings) VALUES (?, ?, ?, ?)",
+                ((job, key, row_hash, json.dumps(sorted(warnings)) if warnings else NO_WARNINGS) for key, (row_hash, warnings) in state.items()),
+            )
+        logging.debug(f"Saved state of {len(state)} rows for {job}")
+
+    def close(self):
+        """
+        Close the state store.
+        """
+        self.db.close()
+
+
+def diff_states(previous, current):
+    """
+    Compare the state of two runs.
+    :param previous: State loaded from the previous run.
+    :param current: State of the current run.
+    :return: Dictionary with "joined" and "left" lists of keys, and "new" and "resolved"
+             dictionaries of key to the set of warnings that appeared or disappeared.
+    """
+    changes = {
+        "joined": sorted(key for key in current if key not in previous),
+        "left": sorted(key for key in previous if key not in current),
+        "new": {},
+        "resolved": {},
+    }
+    for key in current.keys() | previous.keys():
+        old_warnings = previous[key][1] if key in previous else set()
+        new_warnings = current[key][1] if key in current else set()
+        if new_warnings - old_warnings:
+            changes["new"][key] = new_warnings - old_warnings
+        if old_warnings - new_warnings:
+            changes["resolved"][key] = old_warnings - new_warnings
+    return changes
@@ -0,0 +1,75 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import random
+from datetime import datetime, timedelta
+import openpyxl
+
+# generate synthetic staff list spreadsheets for benchmarking
+
+HEADERS = ['Name', 'NBIS mail', 'Unit/Team', 'University', 'Role', 'Employment start', 'Employment end',
+           'Mail active', 'GitHub active', 'Confluence active', 'Redmine active']
+UNITS = ['Systems Development', 'Training', 'Bioinformatics Support', 'Data Management', 'Compute', 'Operations']
+UNIVERSITIES = ['SU', 'UU', 'KI', 'LiU', 'LU', 'UmU', 'GU', 'SLU', 'KTH', 'Chalmers']
+ROLES = ['Developer', 'Bioinformatician', 'System Administrator', 'Team Leader', 'Coordinator', 'Data Steward']
+SERVICES = ['mail active', 'github active', 'confluence active', 'redmine active']
+
+
+def make_workbook(path, rows, seed=0):
+    """
+    Write a synthetic staff list spreadsheet with a Staff and an Exceptions sheet.
+    About a fifth of the staff members have left, some of them with accounts still active.
+    :param path: Path to write the spreadsheet to.
+    :param rows: Number of rows in the Staff sheet.
+    :param seed: Seed for the random generator, the same seed gives the same spreadsheet.
+    """
+    rng = random.Random(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # write only mode streams the rows to disk, so large sheets fit in memory
+    workbook = openpyxl.Workbook(write_only=True)
+    staff_sheet = workbook.create_sheet('Staff')
+    staff_sheet.append(HEADERS)
+    departed = []
+    for i in range(rows):
+        mail = f"person.{i}@nbis.se"
+        start = today - timedelta(days=rng.randint(30, 4000))
+        end = None
+        if rng.random() < 0.2:
+            end = today - timedelta(days=rng.randint(-180, 1000))
+            departed.append(mail)
+        staff_sheet.append([
+            f"Person {i:06d}" if i % 40 else f"Person {i:06d} O'Brien \"Bob\"",
+            mail,
+            rng.choice(UNITS),
+            rng.choice(UNIVERSITIES),
+            rng.choice(ROLES) if i % 50 else 'Developer & <Team Lead>',
+            start,
+            end,
+            'yes' if end is None or rng.random() < 0.1 else 'no',
+            'yes' if end is None or rng.random() < 0.1 else 'no',
+            True if end is None or rng.random() < 0.05 else False,
+            'yes' if end is None or rng.random() < 0.05 else None,
+        ])
+
+    # exceptions for some of the staff members that have left
+    exception_sheet = workbook.create_sheet('Exceptions')
+    exception_sheet.append(['NBIS mail', 'Exceptions', 'Expires'])
+    for mail in rng.sample(departed, len(departed) // 10):
+        expires = today + timedelta(days=rng.randint(-365, 365)) if rng.random() < 0.3 else None
+        exception_sheet.append([mail, ", ".join(rng.sample(SERVICES, rng.randint(1, 2))), expires])
+
+    workbook.save(path)
+
+
+if __name__ == "__main__":
+
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Generate a synthetic staff list spreadsheet.')
+    parser.add_argument('file', type=str, help='Path to write the spreadsheet to')
+    parser.add_argument('-r', '--rows', type=int, help='Number of staff rows (default: 1000)', default=1000)
+    parser.add_argument('--seed', type=int, help='Seed for the random generator (default: 0)', default=0)
+    args = parser.parse_args()
+
+    make_workbook(args.file, args.rows, seed=args.seed)
@@ -0,0 +1,166 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# make the scripts in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spreadsheet
+from Nextcloud import Nextcloud
+from Confluence import Confluence
+from HttpSession import HttpSession
+from Renderer import Renderer
+from Schema import Schema
+from update_confluence_list import build_staff_list, filter_current_staff
+from check_warnings import check_staff
+from StateStore import StateStore
+from generate_workbook import make_workbook
+from stand_ins import NextcloudStandIn, ConfluenceStandIn
+
+# benchmark the pipeline stages on synthetic spreadsheets against local stand-ins
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+PAGE_ID = "4242"
+
+
+def measure(results, stage, memory, func, *args, **kwargs):
+    """
+    Run a stage and record its duration, and its peak memory use if memory is True.
+    :return: The return value of the stage.
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    duration = time.perf_counter() - start
+    results[stage] = {"seconds": round(duration, 4)}
+    if memory:
+        results[stage]["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+    return value
+
+
+def parse(content):
+    """
+    Parse the Staff and Exceptions sheets into memory.
+    """
+    workbook = spreadsheet.load_workbook(content)
+    header_mapping, staff_rows = spreadsheet.read_sheet(workbook, 'Staff')
+    staff_rows = list(staff_rows)
+    _, exception_rows = spreadsheet.read_sheet(workbook, 'Exceptions', stop_at_blank=True)
+    exception_rows = list(exception_rows)
+    workbook.close()
+    return header_mapping, staff_rows, exception_rows
+
+
+def run_benchmark(rows, workdir, memory=False, latency=0):
+    """
+    Run all stages once on a spreadsheet with the given number of rows.
+    :return: Dictionary of stage name to its measurements.
+    """
+
+    # generate the spreadsheet once per size and seed
+    path = os.path.join(workdir, f"staff_{rows}.xlsx")
+    if not os.path.exists(path):
+        logging.info(f"Generating spreadsheet with {rows} rows...")
+        make_workbook(path, rows)
+
+    nextcloud_server = NextcloudStandIn(latency=latency)
+    confluence_server = ConfluenceStandIn(latency=latency)
+    with open(path, 'rb') as f:
+        nextcloud_server.set_file("staff.xlsx", f.read())
+    confluence_server.add_page(PAGE_ID, "Staff list")
+
+    config = {
+        "nextcloud": {"base_url": nextcloud_server.url, "username": "bench", "password": "bench",
+                      "remote_file_path": "staff.xlsx", "cache_dir": os.path.join(workdir, f"cache_{rows}_{os.getpid()}")},
+        "confluence": {"base_url": confluence_server.url, "space_key": "BENCH", "page_id": PAGE_ID,
+                       "username": "bench", "api_key": "bench"},
+    }
+    args = argparse.Namespace(keep=False, file=None)
+    session = HttpSession(config)
+    results = {"rows": rows, "bytes": os.path.getsize(path)}
+
+    try:
+        nextcloud = Nextcloud(config, args, session=session)
+        measure(results, "download", memory, nextcloud.download_spreadsheet)
+        measure(results, "download_not_modified", memory, nextcloud.download_spreadsheet)
+        header_mapping, staff_rows, exception_rows = measure(results, "parse", memory, parse, nextcloud.get_spreadsheet())
+        measure(results, "parse_and_snapshot", memory, nextcloud.read_sheets, [('Staff', False), ('Exceptions', True)])
+        measure(results, "parse_snapshot", memory, nextcloud.read_sheets, [('Staff', False), ('Exceptions', True)])
+        staff_rows, _ = measure(results, "normalize", memory, Schema(header_mapping).normalize, staff_rows)
+        staff_list = measure(results, "filter", memory, lambda: filter_current_staff(build_staff_list(header_mapping, staff_rows)))
+        html_content = measure(results, "render", memory, Renderer(config).render, staff_list, datetime.now())
+        confluence = Confluence(config, args, session=session)
+        measure(results, "upload", memory, confluence.update_staff_list_page, "BENCH", PAGE_ID, html_content)
+        measure(results, "upload_unchanged", memory, confluence.update_staff_list_page, "BENCH", PAGE_ID, html_content)
+        measure(results, "checks", memory, check_staff, config, header_mapping, staff_rows, exception_rows)
+
+        # with --state, compared to the state saved by a previous run
+        state = StateStore(os.path.join(workdir, f"state_{rows}_{os.getpid()}.db"))
+        check_staff(config, header_mapping, staff_rows, exception_rows, state=state)
+        measure(results, "checks_state", memory, check_staff, config, header_mapping, staff_rows, exception_rows, state=state)
+        state.close()
+        results["requests"] = len(nextcloud_server.requests) + len(confluence_server.requests)
+    finally:
+        session.close()
+        nextcloud_server.stop()
+        confluence_server.stop()
+
+    return results
+
+
+def print_report(all_results):
+    """
+    Print the results as a table with one row per spreadsheet size.
+    """
+    stages = [key for key, value in all_results[0].items() if isinstance(value, dict)]
+    widths = [max(len(stage), 16) for stage in stages]
+    print(f"{'rows':>8} {'MB':>7} " + " ".join(f"{stage:>{width}}" for stage, width in zip(stages, widths)))
+    for results in all_results:
+        cells = []
+        for stage, width in zip(stages, widths):
+            cell = f"{results[stage]['seconds']:.3f}s"
+            if "peak_mb" in results[stage]:
+                cell += f" {results[stage]['peak_mb']:.1f}MB"
+            cells.append(f"{cell:>{width}}")
+        print(f"{results['rows']:>8} {results['bytes'] / 1024 / 1024:>7.2f} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Benchmark the staff list pipeline on synthetic spreadsheets.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', help=f'Number of staff rows to benchmark (default: {DEFAULT_SIZES})', default=DEFAULT_SIZES)
+    parser.add_argument('-w', '--workdir', type=str, help='Directory to keep the generated spreadsheets in (default: a temporary directory)')
+    parser.add_argument('-m', '--memory', action='store_true', help='Also measure peak memory use per stage (slows the stages down)')
+    parser.add_argument('-l', '--latency', type=float, help='Simulated network latency per request in seconds (default: 0)', default=0)
+    parser.add_argument('-j', '--json', type=str, help='Write the results as JSON to this file')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose mode')
+    args = parser.parse_args()
+
+    # only show the benchmark's own progress, not the warnings found by the checks
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="staff-list-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    all_results = []
+    for rows in args.sizes:
+        all_results.append(run_benchmark(rows, workdir, memory=args.memory, latency=args.latency))
+    print_report(all_results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# local stand-ins for the Nextcloud WebDAV, Confluence and GitHub APIs, for benchmarks and tests
+
+
+class StandInServer:
+    def __init__(self, handler_class, latency=0):
+        """
+        Start a stand-in server on a free local port.
+        :param handler_class: Request handler class of the stand-in.
+        :param latency: Seconds to wait before answering each request, to simulate a remote server.
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def log_request(self, method, path):
+        """
+        Record a request, so tests and benchmarks can count them.
+        """
+        with self.lock:
+            self.requests.append((method, path))
+        if self.latency:
+            time.sleep(self.latency)
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type="application/json", headers=None):
+        """
+        Send a response with a body.
+        """
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def read_json(self):
+        """
+        Read a JSON request body.
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+class NextcloudStandIn(StandInServer):
+    def __init__(self, latency=0):
+        """
+        Stand-in for the Nextcloud WebDAV API, serving files with ETag and Last-Modified headers.
+        """
+        self.files = {}
+        super().__init__(NextcloudHandler, latency=latency)
+
+    def set_file(self, path, content):
+        """
+        Add or replace a file.
+        :param path: Path of the file below the user's WebDAV root, e.g. "folder/staff.xlsx".
+        :param content: File content as bytes.
+        """
+        with self.lock:
+            self.files[path.strip("/")] = {
+                "content": content,
+                "etag": f'"{hashlib.md5(content).hexdigest()}"',
+                "last_modified": formatdate(time.time(), usegmt=True),
+            }
+
+
+class NextcloudHandler(StandInHandler):
+
+    def find_file(self):
+        """
+        Find the requested file, WebDAV paths look like /remote.php/dav/files/<user>/<path>.
+        """
+        parts = unquote(urlparse(self.path).path).split("/", 5)
+        if len(parts) < 6 or parts[1:4] != ["remote.php", "dav", "files"]:
+            return None
+        return self.server.stand_in.files.get(parts[5])
+
+    def not_modified(self, file):
+        """
+        Check the conditional request headers against a file.
+        """
+        if "If-None-Match" in self.headers:
+            return self.headers["If-None-Match"] == file["etag"]
+        if "If-Modified-Since" in self.headers:
+            try:
+                return parsedate_to_datetime(self.headers["If-Modified-Since"]) >= parsedate_to_datetime(file["last_modified"])
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_GET(self):
+        self.server.stand_in.log_request(self.command, self.path)
+        file = self.find_file()
+        if file is None:
+            self.send_body(404, b"", content_type="text/plain")
+            return
+        headers = {"ETag": file["etag"], "Last-Modified": file["last_modified"]}
+        if self.not_modified(file):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_body(200, file["content"], content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers=headers)
+
+    do_HEAD = do_GET
+
+    def do_PROPFIND(self):
+        self.server.stand_in.log_request(self.command, self.path)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        file = self.find_file()
+        if file is None:
+            self.send_body(404, b"", content_type="text/plain")
+            return
+        body = f"""<?xml version="1.0"?>
+<d:multistatus xmlns:d="DAV:">
+  <d:response>
+    <d:href>{self.path}</d:href>
+    <d:propstat>
+      <d:prop>
+        <d:getetag>{file["etag"]}</d:getetag>
+        <d:getlastmodified>{file["last_modified"]}</d:getlastmodified>
+        <d:getcontentlength>{len(file["content"])}</d:getcontentlength>
+      </d:prop>
+      <d:status>HTTP/1.1 200 OK</d:status>
+    </d:propstat>
+  </d:response>
+</d:multistatus>"""
+        self.send_body(207, body, content_type="application/xml; charset=utf-8")
+
+
+class ConfluenceStandIn(StandInServer):
+    def __init__(self, latency=0, space_id="1"):
+        """
+        Stand-in for the Confluence v2 pages API and the group members listing.
+        """
+        self.pages = {}
+        self.groups = {}
+        self.space_id = space_id
+        self.next_id = 1000
+        super().__init__(ConfluenceHandler, latency=latency)
+
+    def add_page(self, page_id, title, body="", parent_id=None):
+        """
+        Add a page.
+        """
+        with self.lock:
+            self.pages[str(page_id)] = {
+                "id": str(page_id),
+                "status": "current",
+                "title": title,
+                "spaceId": self.space_id,
+                "parentId": str(parent_id) if parent_id is not None else None,
+                "version": {"number": 1},
+                "body": {"storage": {"value": reserialize(body), "representation": "storage"}},
+            }
+
+
+    def set_group(self, group, members):
+        """
+        Set the members of a user group.
+        :param members: Mail addresses, or dictionaries with "accountId" and "email", None hides the address.
+        """
+        with self.lock:
+            self.groups[group] = [member if isinstance(member, dict) else {"accountId": f"id-{member}", "email": member}
+                                  for member in members]
+
+
+def reserialize(body):
+    """
+    Change a page body the way Confluence does when it stores it: tables get a <tbody> and
+    layout attributes, and quotes and non-breaking spaces are escaped differently.
+    """
+    body = re.sub(r"<table>(.*?)</table>", r'<table data-layout="default" data-table-width="760"><tbody>\1</tbody></table>', body, flags=re.DOTALL)
+    return body.replace("&#x27;", "'").replace("&quot;", '"').replace("&nbsp;", "&#160;")
+
+
+class ConfluenceHandler(StandInHandler):
+
+    def route(self):
+        """
+        Split the request path into the parts after /wiki/api/v2/pages.
+        """
+        path = urlparse(self.path).path
+        prefix = "/wiki/api/v2/pages"
+        if not path.startswith(prefix):
+            return None
+        return [part for part in path[len(prefix):].split("/") if part]
+
+    def group_members(self):
+        """
+        List a page of the members of a group, /wiki/rest/api/group/<group>/member?limit=&start=.
+        """
+        stand_in = self.server.stand_in
+        url = urlparse(self.path)
+        group = unquote(url.path.split("/")[5])
+        if group not in stand_in.groups:
+            self.send_body(404, {"message": "Not found"})
+            return
+        query = parse_qs(url.query)
+        limit = int(query.get("limit", ["200"])[0])
+        start = int(query.get("start", ["0"])[0])
+        members = [{"type": "known", **member} for member in stand_in.groups[group][start:start + limit]]
+        self.send_body(200, {"results": members, "start": start, "limit": limit, "size": len(members)})
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        stand_in.log_request(self.command, self.path)
+        if urlparse(self.path).path.startswith("/wiki/rest/api/group/"):
+            self.group_members()
+            return
+        parts = self.route()
+        if not parts or parts[0] not in stand_in.pages:
+            self.send_body(404, {"message": "Not found"})
+        elif len(parts) == 2 and parts[1] in ("children", "direct-children"):
+            children = [{"id": page["id"], "title": page["title"]} for page in stand_in.pages.values() if page["parentId"] == parts[0]]
+            self.send_body(200, {"results": children, "_links": {}})
+        else:
+            self.send_body(200, stand_in.pages[parts[0]])
+
+    def do_PUT(self):
+        stand_in = self.server.stand_in
+        stand_in.log_request(self.command, self.path)
+        parts = self.route()
+        content = self.read_json()
+        if not parts or parts[0] not in stand_in.pages:
+            self.send_body(404, {"message": "Not found"})
+            return
+        with stand_in.lock:
+            page = stand_in.pages[parts[0]]
+
+            # the new version number must follow the current one
+            if content["version"]["number"] != page["version"]["number"] + 1:
+                self.send_body(409, {"message": "Version conflict"})
+                return
+            page["title"] = content["title"]
+            page["version"] = {"number": content["version"]["number"]}
+            page["body"] = {"storage": {"value": reserialize(content["body"]["storage"]["value"]), "representation": "storage"}}
+        self.send_body(200, page)
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        stand_in.log_request(self.command, self.path)
+        content = self.read_json()
+        with stand_in.lock:
+            stand_in.next_id += 1
+            page_id = str(stand_in.next_id)
+        stand_in.add_page(page_id, content["title"], content["body"]["value"], parent_id=content.get("parentId"))
+        self.send_body(200, stand_in.pages[page_id])
+
+
+class GitHubStandIn(StandInServer):
+    def __init__(self, latency=0):
+        """
+        Stand-in for the GitHub organisation members API.
+        """
+        self.members = {}
+        super().__init__(GitHubHandler, latency=latency)
+
+    def set_members(self, org, logins):
+        """
+        Set the logins of the members of an organisation.
+        """
+        with self.lock:
+            self.members[org] = {login.lower() for login in logins}
+
+
+class GitHubHandler(StandInHandler):
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        stand_in.log_request(self.command, self.path)
+
+        # /orgs/<org>/members/<login> answers 204 for members and 404 for everyone else
+        parts = [unquote(part) for part in urlparse(self.path).path.split("/") if part]
+        if len(parts) == 4 and parts[0] == "orgs" and parts[2] == "members" and parts[3].lower() in stand_in.members.get(parts[1], ()):
+            self.send_body(204, "")
+        else:
+            self.send_body(404, {"message": "Not Found"})
@@ -2,146 +2,71 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import requests
-import yaml
-from requests.auth import HTTPBasicAuth
-import pdb
 import logging
-import sys
-import os
-import openpyxl
-from datetime import datetime
-from datetime import timedelta
-
-# employment grace period in days
-EMPLOYMENT_GRACE_PERIOD_DAYS = 90
-
-
-def download_spreadsheet(config, args):
-    """
-    Download a spreadsheet from a given URL using basic authentication.
-    """
-
-    logging.debug("Starting download_spreadsheet function...")
-
-    # Download the spreadsheet
-    logging.info("Downloading spreadsheet...")
-    logging.debug(f"Using URL: {config['base_url']}/remote.php/dav/files/{config['username']}/{config['remote_file_path']}")
-    response = requests.get(f"{config['base_url']}/remote.php/dav/files/{config['username']}/{config['remote_file_path']}", auth=HTTPBasicAuth(config['username'], config['password']))
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        with open(args.file, 'wb') as f:
-            f.write(response.content)
-        logging.info("Spreadsheet downloaded successfully.")
-    else:
-        logging.error("Failed to download the spreadsheet.")
-
-
-
-
-def run_checks(file_path):
+from Nextcloud import Nextcloud
+from RuleEngine import RuleEngine
+from Schema import Schema, report_problems
+from ExceptionIndex import ExceptionIndex
+from StateStore import StateStore, diff_states
+from HttpSession import HttpSession
+from Metrics import Metrics
+import pipeline
+import jobs
+import cli
+
+
+def check_staff(config, header_mapping, staff_rows, exception_rows, state=None, full_report=False, metrics=None, session=None):
     """
-    Run checks on the downloaded spreadsheet.
+    Run checks on the rows of the staff sheet and report the warnings.
+    :param config: Dictionary containing configuration parameters.
+    :param header_mapping: Header mapping of the Staff sheet from spreadsheet.read_sheet().
+    :param staff_rows: Typed rows of the Staff sheet from Schema.normalize().
+    :param exception_rows: Rows of the Exceptions sheet.
+    :param state: StateStore to only report changes since the previous run, None to report all warnings.
+    :param full_report: If True, report all warnings even when using a state store.
+    :param metrics: Metrics instance to record the run in, or None.
+    :param session: Shared HttpSession for verifying the accounts, or None.
+    :return: Dictionary of user mail to the set of warnings for that user.
     """
 
-    logging.debug("Starting run_checks function...")
+    logging.debug("Starting check_staff function...")
+    metrics = metrics or Metrics()
+    exceptions = parse_exceptions(exception_rows)
+    metrics.set('expired_exceptions', len(exceptions.expired))
 
-    # Load the staff spreadsheet
-    logging.info("Loading spreadsheet...")
-    try:
-        workbook = openpyxl.load_workbook(file_path)
-        staff_sheet = workbook['Staff']
-    except Exception as e:
-        logging.error(f"Failed to load spreadsheet: {e}")
-        sys.exit(1)
-
-    # load the exception spreadsheet
-    logging.info("Loading exception spreadsheet...")
-    try:
-        exception_sheet = workbook['Exceptions']
-    except Exception as e:
-        logging.error(f"Failed to load exception spreadsheet: {e}")
-        sys.exit(1)
-    exceptions = parse_exceptions(exception_sheet)
-
-    # create header to column mapping
-    logging.debug("Creating header to column mapping...")
-    headers = staff_sheet[1]  # Assuming the first row contains headers
-    header_mapping = {}
-    for col in range(0, len(headers)):
-        header_mapping[headers[col].value] = col
-    logging.debug(f"Header mapping: {header_mapping}")
-
-    # initialize a dictionary to store warnings
-    warnings = {}
-
-    # for each row in the spreadsheet
+    # compile the rules once and evaluate all rows in one pass
     logging.info("Running checks on the spreadsheet...")
-    for row in staff_sheet.iter_rows(min_row=2, values_only=True):  # Skip header row
-        logging.debug(f"Processing row: {row}")
-
-        # check if first column is empty, i.e. end of the list
-        if row[0] is None:
-            logging.debug("First column is empty, ending processing.")
-            break
-
-        # readability
-        user_mail = row[header_mapping['nbis mail']]
-        user_warnings = set()
-
-        # get execeptions if any
-        if user_mail in exceptions:
-            user_exceptions = exceptions[user_mail]
-        else:
-            user_exceptions = set()
-
-        # check if the employee has been terminated more than n days ago
-        if not check_employee_active(row, header_mapping, EMPLOYMENT_GRACE_PERIOD_DAYS=EMPLOYMENT_GRACE_PERIOD_DAYS):
-
-            # check if the email is still active
-            if row[header_mapping['mail active']] in ["yes", True]:
-                logging.debug(f"Email is still active: {user_mail}")
-                # check if the user has exceptions
-                if "mail active" in user_exceptions:
-                    logging.debug(f"User {user_mail} has exception for mail active.")
-                else:
-                    user_warnings.add("mail active")
-
-            # check if github is still active
-            if row[header_mapping['github active']] in ["yes", True]:
-                logging.debug(f"Github is still active: {user_mail}")
-                # check if the user has exceptions
-                if "github active" in user_exceptions:
-                    logging.debug(f"User {user_mail} has exception for github active.")
-                else:
-                    user_warnings.add("github active")
-
-            # check if confluence is still active
-            if row[header_mapping['confluence active']] in ["yes", True]:
-                logging.debug(f"Confluence is still active: {user_mail}")
-                # check if the user has exceptions
-                if "confluence active" in user_exceptions:
-                    logging.debug(f"User {user_mail} has exception for confluence active.")
-                else:
-                    user_warnings.add("confluence active")
-
-            # check if redmine is still active
-            service_name = "redmine"
-            if row[header_mapping[f'{service_name} active']] in ["yes", True]:
-                logging.debug(f"{service_name.capitalize()} is still active: {user_mail}")
-                # check if the user has exceptions
-                if f"{service_name} active" in user_exceptions:
-                    logging.debug(f"User {user_mail} has exception for {service_name} active.")
-                else:
-                    user_warnings.add(f"{service_name} active")
-
-
-            # check if there were any warnings
-            if len(user_warnings) > 0:
-                logging.debug(f"User {user_mail} has warnings: {user_warnings}")
-                warnings[user_mail] = user_warnings
-
+    rules = RuleEngine(config, header_mapping)
+
+    # use the real account states of departed staff, if services to verify against are configured
+    if config.get('verify'):
+        import verifiers
+        logging.info("Verifying the accounts of departed staff...")
+        with metrics.stage('verify'):
+            staff_rows = verifiers.verify_rows(config, header_mapping, staff_rows, rules.is_departed, session=session, metrics=metrics)
+
+    if state is None:
+        with metrics.stage('checks'):
+            warnings = rules.evaluate(staff_rows, exceptions)
+    else:
+        # report what changed since the previous run
+        previous = state.load(jobs.job_key(config, 'check'))
+        with metrics.stage('checks'):
+            warnings, current = rules.evaluate_state(staff_rows, exceptions)
+        changes = diff_states(previous, current)
+
+        # everyone would be added to the list on the first run
+        if not previous:
+            changes['joined'] = []
+        report_changes(changes)
+        state.save(jobs.job_key(config, 'check'), current)
+        metrics.set('new_warnings', sum(len(user_warnings) for user_warnings in changes['new'].values()))
+        metrics.set('resolved_warnings', sum(len(user_warnings) for user_warnings in changes['resolved'].values()))
+
+    metrics.set('rows_parsed', rules.rows_checked)
+    metrics.set('warnings', sum(len(user_warnings) for user_warnings in warnings.values()))
+    if state is not None and not full_report:
+        return warnings
 
     # check if there were any warnings
     if len(warnings) > 0:
@@ -149,132 +74,77 @@ def run_checks(file_path):
         for user_mail, user_warnings in warnings.items():
             logging.warning(f"User {user_mail} has warnings: {user_warnings}")
 
+    return warnings
 
-# check if a service is still active
-def check_service_active(row, header_mapping, service_name):
-    """
-    Check if a service is still active.
-    """
-
-    logging.debug("Starting check_service_active function...")
 
-    # check if the service is still active
-    if row[header_mapping[f'{service_name} active']] in ["yes", True]:
-        logging.debug(f"{service_name.capitalize()} is still active: {user_mail}")
-        # check if the user has exceptions
-        if f"{service} active" in user_exceptions:
-            logging.debug(f"User {user_mail} has exception for {service_name} active.")
-        else:
-            user_warnings.add(f"{service_name} active")
-
-
-# function to check if a employee is still active
-def check_employee_active(row, header_mapping, EMPLOYMENT_GRACE_PERIOD_DAYS=EMPLOYMENT_GRACE_PERIOD_DAYS):
+# function to report the changes since the previous run
+def report_changes(changes):
     """
-    Check if an employee is still active.
+    Report new and resolved warnings, and users added to or removed from the sheet.
+    :param changes: Changes from StateStore.diff_states().
     """
-
-    logging.debug("Starting check_employee_active function...")
-
-    # check if the employee has been terminated
-    if row[header_mapping['employment end']] is not None:
-        employment_end_date = row[header_mapping['employment end']]
-
-        # check if the date is more than n days ago
-        date_grace_period = datetime.now() - timedelta(days=(EMPLOYMENT_GRACE_PERIOD_DAYS))
-        if employment_end_date < date_grace_period:
-            logging.debug(f"Employee terminated more than {EMPLOYMENT_GRACE_PERIOD_DAYS} days ago: {row[header_mapping['nbis mail']]}")
-            return False
-
-    return True
+    for user_mail, user_warnings in sorted(changes['new'].items()):
+        logging.warning(f"User {user_mail} has new warnings: {user_warnings}")
+    for user_mail, user_warnings in sorted(changes['resolved'].items()):
+        logging.info(f"User {user_mail} has resolved warnings: {user_warnings}")
+    for user_mail in changes['joined']:
+        logging.info(f"User {user_mail} added to the staff list.")
+    for user_mail in changes['left']:
+        logging.info(f"User {user_mail} removed from the staff list.")
 
 
 # function to parse the exceptions spreadsheet
-def parse_exceptions(exception_sheet):
+def parse_exceptions(exception_rows):
     """
-    Parse the exceptions spreadsheet.
+    Parse the exceptions spreadsheet, and report the exceptions that have expired.
+    :param exception_rows: Rows of the Exceptions sheet, without the header.
+    :return: ExceptionIndex of the exceptions that are still valid.
     """
 
     logging.debug("Starting parse_exceptions function...")
+    exceptions = ExceptionIndex(exception_rows)
+    exceptions.report_expired()
+    return exceptions
 
-    # create a dictionary to store exceptions
-    exceptions = {}
-    #pdb.set_trace()
-
-    # for each row in the spreadsheet
-    for row in exception_sheet.iter_rows(min_row=2, values_only=True):  # Skip header row
-        logging.debug(f"Processing exception row: {row}")
 
-        # check if first column is empty, i.e. end of the list
-        if row[0] is None:
-            logging.debug("First column is empty, ending processing.")
-            break
+def main(args, config, session=None, metrics=None):
+    """
+    Download the spreadsheet and run the checks.
+    :param args: Command-line arguments.
+    :param config: Dictionary containing configuration parameters.
+    :param session: Shared HttpSession, a new one is created if None.
+    :param metrics: Metrics instance to record the run in. If None, a new one is created and written when the process exits.
+    """
 
-        # readabilty
-        user_mail = row[0]
-        try:
-            user_exceptions = row[1].split(",")
-        except Exception as e:
-            user_exceptions = []
+    metrics = pipeline.run_metrics(args, metrics, 'check')
+    nextcloud = Nextcloud(config, args, session=session or HttpSession(config, metrics=metrics))
 
-        # add the exception to the dictionary
-        logging.debug(f"Adding exception for user: {user_mail} with exception(s): {user_exceptions}")
-        for user_exception in user_exceptions:
-            logging.debug(f"Processing user exception: {user_exception.strip()}")
+    # download and parse the spreadsheet
+    _, sheets, _, _ = pipeline.load_spreadsheet(args, config, nextcloud, metrics, ['check'])
+    (header_mapping, staff_rows), (_, exception_rows) = sheets['check']
 
-            # check if the user already has exceptions
-            if user_mail not in exceptions:
-                exceptions[user_mail] = set()
+    # convert the cells into typed values once
+    with metrics.stage('normalize'):
+        staff_rows, problems = Schema(header_mapping).normalize(staff_rows)
+    report_problems(problems)
+    metrics.set('invalid_values', len(problems))
 
-            # add the exception to the set
-            logging.debug(f"Adding exception: {user_exception.strip()} to user: {user_mail}")
-            exceptions[user_mail].add(user_exception.strip())
+    # run checks on the parsed rows
+    state = StateStore(args.state) if args.state else None
+    check_staff(config, header_mapping, staff_rows, exception_rows, state=state, full_report=args.full, metrics=metrics, session=nextcloud.session)
+    nextcloud.mark_processed(jobs.job_key(config, 'check'))
+    metrics.set('success', True)
 
-    return exceptions
 
 if __name__ == "__main__":
 
     # Parse command-line arguments
-    parser = argparse.ArgumentParser(description='Process some integers.')
-    parser.add_argument('-c', '--config', type=str, help='Path to YAML configuration file', required=True)
-    parser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
-    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose mode')
-    parser.add_argument('-f', '--file', type=str, help='Path to where the stafflist will be downloaded (default: /tmp/)', default='/tmp/nbis_staff.xlsx')
-    parser.add_argument('-k', '--keep', action='store_true', help='Keep the downloaded file after processing')
+    parser = argparse.ArgumentParser(description='Check the staff list spreadsheet in Nextcloud for accounts that should have been closed.')
+    cli.add_common_arguments(parser)
+    parser.add_argument('--state', type=str, help='Path to a state file, to only report changes since the previous run')
+    parser.add_argument('--full', action='store_true', help='Report all warnings even when using --state')
+    cli.add_job_argument(parser)
     args = parser.parse_args()
 
-    # Set up logging
-    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
-
-    # Enable verbose mode if specified
-    if args.verbose:
-        logging.getLogger().setLevel(logging.INFO)
-        logging.info("Verbose mode enabled.")
-
-    # Enable debug mode if specified
-    if args.debug:
-        logging.getLogger().setLevel(logging.DEBUG)
-        logging.debug("Debug mode enabled.")
-
-    # Read in user credentials and other configs from the YAML file
-    logging.debug("Reading configuration file...")
-    with open(args.config, 'r') as file:
-        config = yaml.safe_load(file)
-
-    # download the spreadsheet
-    download_spreadsheet(config, args)
-
-    # run checks on the downloaded file
-    run_checks(args.file)
-
-    # remove the downloaded file if not keeping it
-    logging.debug("Checking if the file should be removed...")
-    if not args.keep:
-        logging.debug("Removing the downloaded file...")
-        try:
-            os.remove(args.file)
-            logging.info(f"Removed downloaded file: {args.file}")
-        except Exception as e:
-            logging.error(f"Failed to remove file: {e}")
-            sys.exit(1)
-
+    cli.setup_logging(args)
+    jobs.run(args, cli.load_config(args.config), main, 'check')
@@ -0,0 +1,98 @@
+import logging
+import sys
+from jobcontext import JOB_NAME
+
+# command-line helpers shared by the scripts, kept free of heavy imports so they start fast
+
+# configuration keys that must be set, per section
+REQUIRED_CONFIG = {
+    "nextcloud": ["base_url", "username", "password", "remote_file_path"],
+    "confluence": ["base_url", "space_key", "page_id", "username", "api_key"],
+}
+
+
+def add_common_arguments(parser):
+    """
+    Add the arguments shared by all scripts to an argparse parser.
+    """
+    parser.add_argument('-c', '--config', type=str, help='Path to YAML configuration file', required=True)
+    parser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose mode')
+    parser.add_argument('-f', '--file', type=str, help='Path to where the stafflist will be saved when using --keep, with jobs the job name is added before the extension (default: /tmp/nbis_staff.xlsx)', default='/tmp/nbis_staff.xlsx')
+    parser.add_argument('-k', '--keep', action='store_true', help='Save a copy of the downloaded file to --file')
+    parser.add_argument('-s', '--skip-unchanged', action='store_true', help='Do nothing if the spreadsheet has not changed since the last successful run')
+    parser.add_argument('--metrics-json', type=str, help='Append the run metrics as a JSON line to this file, - for stdout')
+    parser.add_argument('--metrics-prom', type=str, help='Write the run metrics to this Prometheus textfile collector file')
+    parser.add_argument('--profile', type=str, metavar='DIR', help='Write CPU and memory profiles of each stage of the run to this directory')
+
+
+def add_job_argument(parser):
+    """
+    Add the argument to select jobs, for configurations with a "jobs" list.
+    """
+    parser.add_argument('-j', '--job', type=str, action='append', help='Only run the job with this name, can be given more than once (default: all jobs)')
+
+
+def setup_logging(args):
+    """
+    Set up logging according to the --verbose and --debug arguments.
+    """
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(job)s%(message)s')
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(JobNameFilter())
+
+    # Enable verbose mode if specified
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+        logging.info("Verbose mode enabled.")
+
+    # Enable debug mode if specified
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+        logging.debug("Debug mode enabled.")
+
+
+class JobNameFilter(logging.Filter):
+    def filter(self, record):
+        """
+        Add the name of the job being run to a log record as "job", e.g. "[consultants] ", empty outside of jobs.
+        """
+        name = JOB_NAME.get()
+        record.job = f"[{name}] " if name else ""
+        return True
+
+
+def load_config(path):
+    """
+    Read in user credentials and other configs from the YAML file.
+    :param path: Path to the YAML configuration file.
+    :return: Dictionary containing configuration parameters.
+    """
+    import yaml
+
+    logging.debug("Reading configuration file...")
+    try:
+        with open(path, 'r') as file:
+            config = yaml.safe_load(file)
+    except (OSError, yaml.YAMLError) as e:
+        logging.error(f"Failed to read configuration file: {e}")
+        sys.exit(1)
+    return config or {}
+
+
+def validate_config(config, sections=("nextcloud", "confluence")):
+    """
+    Check that the required configuration keys are set.
+    :param config: Dictionary containing configuration parameters.
+    :param sections: Sections of the configuration to check.
+    :return: List of problems found, empty if the configuration is valid.
+    """
+    problems = []
+    for section in sections:
+        if not isinstance(config.get(section), dict):
+            problems.append(f"Missing section '{section}'")
+            continue
+        for key in REQUIRED_CONFIG[section]:
+            if config[section].get(key) in (None, ""):
+                problems.append(f"Missing '{section}.{key}'")
+    return problems
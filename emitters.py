@@ -0,0 +1,227 @@
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from html import escape
+from Renderer import Renderer, parse_columns
+
+# write the published staff list in several formats, from a single pass over the staff members
+
+# page around the table of the static HTML export
+HTML_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Master staff list updated: {modified}</p>
+{table}
+</body>
+</html>
+"""
+DEFAULT_HTML_TITLE = "NBIS staff list"
+
+
+class Emitter:
+    # name of the format, as used in the "export" section of the config
+    name = None
+
+    def __init__(self, config, settings):
+        """
+        Render the staff list in one format. The staff members are fed one at a time with add(),
+        so all formats are rendered in the same pass over the list.
+        :param config: Dictionary containing configuration parameters.
+        :param settings: Settings of the format from the "export" section, "path" is the file to write to.
+        """
+        self.config = config
+        self.settings = settings or {}
+        self.path = self.settings.get('path')
+
+        # the published columns, unless the format has its own
+        self.columns = parse_columns(self.settings['columns']) if self.settings.get('columns') else Renderer(config).columns
+
+    def start(self, modified):
+        """
+        Start rendering.
+        :param modified: Datetime when the master staff list was last modified.
+        """
+        self.modified = modified
+
+    def add(self, staff_member):
+        """
+        Add a staff member, in the order they are listed.
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """
+        Finish rendering.
+        :return: The rendered content as a string.
+        """
+        raise NotImplementedError
+
+
+class ConfluenceEmitter(Emitter):
+    name = "confluence"
+
+    def __init__(self, config, settings):
+        super().__init__(config, settings)
+        self.renderer = Renderer(config)
+
+    def start(self, modified):
+        super().start(modified)
+        self.parts = [self.renderer.render_intro(modified), self.renderer.render_table_header()]
+
+    def add(self, staff_member):
+        self.parts.append(self.renderer.render_row(staff_member))
+
+    def finish(self):
+        self.parts.append(self.renderer.render_table_footer())
+        return "".join(self.parts)
+
+
+class HtmlEmitter(Emitter):
+    name = "html"
+
+    def __init__(self, config, settings):
+        super().__init__(config, settings)
+        self.renderer = Renderer(config, columns=self.columns)
+
+    def start(self, modified):
+        super().start(modified)
+        self.parts = [self.renderer.render_table_header()]
+
+    def add(self, staff_member):
+        self.parts.append(self.renderer.render_row(staff_member))
+
+    def finish(self):
+        self.parts.append(self.renderer.render_table_footer())
+        return HTML_PAGE.format(title=escape(self.settings.get('title', DEFAULT_HTML_TITLE)),
+                                modified=self.modified.strftime("%Y-%m-%d %H:%M"), table="".join(self.parts))
+
+
+class CsvEmitter(Emitter):
+    name = "csv"
+
+    def start(self, modified):
+        super().start(modified)
+        self.output = io.StringIO()
+        self.writer = csv.writer(self.output)
+        self.writer.writerow([title for _, title in self.columns])
+
+    def add(self, staff_member):
+        self.writer.writerow([format_value(staff_member.get(header)) for header, _ in self.columns])
+
+    def finish(self):
+        return self.output.getvalue()
+
+
+class JsonEmitter(Emitter):
+    name = "json"
+
+    def start(self, modified):
+        super().start(modified)
+        self.staff = []
+
+    def add(self, staff_member):
+        self.staff.append({header: format_value(staff_member.get(header)) for header, _ in self.columns})
+
+    def finish(self):
+        return json.dumps({"modified": self.modified.isoformat(), "staff": self.staff}, indent=1, ensure_ascii=False) + "\n"
+
+
+# emitters by format name, add an Emitter subclass here to export another format
+EMITTERS = {
+    "confluence": ConfluenceEmitter,
+    "csv": CsvEmitter,
+    "json": JsonEmitter,
+    "html": HtmlEmitter,
+}
+
+
+def render_all(config, staff_list, modified):
+    """
+    Render the Confluence page and every format of the "export" section in a single pass.
+    :param config: Dictionary containing configuration parameters.
+    :param staff_list: The staff members to list, in order, e.g. from filter_current_staff().
+    :param modified: Datetime when the master staff list was last modified.
+    :return: Dictionary of format name to a (Emitter, rendered content) tuple.
+    """
+    export_config = config.get('export') or {}
+    unknown = set(export_config) - set(EMITTERS)
+    if unknown:
+        logging.warning(f"Unknown export formats, ignoring them: {', '.join(sorted(unknown))}")
+
+    emitters = [ConfluenceEmitter(config, export_config.get("confluence"))]
+    emitters += [EMITTERS[name](config, settings) for name, settings in export_config.items()
+                 if name in EMITTERS and name != "confluence"]
+
+    for emitter in emitters:
+        emitter.start(modified)
+    for staff_member in staff_list:
+        for emitter in emitters:
+            emitter.add(staff_member)
+    return {emitter.name: (emitter, emitter.finish()) for emitter in emitters}
+
+
+def write_outputs(outputs):
+    """
+    Write the rendered formats that have a path. Files are replaced atomically, and not written
+    at all if their content is unchanged, so readers never see partial files and timestamps stay.
+    :param outputs: Rendered formats from render_all().
+    :return: Tuple of (number of files written, number of files that failed to write).
+    """
+    written = failed = 0
+    for name, (emitter, content) in outputs.items():
+        if not emitter.path:
+            continue
+        try:
+            if write_if_changed(emitter.path, content):
+                written += 1
+                logging.info(f"Exported the staff list as {name} to {emitter.path}")
+            else:
+                logging.debug(f"The {name} export {emitter.path} is unchanged.")
+        except OSError as e:
+            logging.error(f"Failed to export the staff list as {name} to {emitter.path}: {e}")
+            failed += 1
+    return written, failed
+
+
+def write_if_changed(path, content):
+    """
+    Atomically replace a file with new content, unless it already has that content.
+    :return: True if the file was written.
+    """
+    data = content.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+    return True
+
+
+def format_value(value):
+    """
+    Format a cell value as plain text, dates as YYYY-MM-DD.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value if isinstance(value, (str, int, float, bool)) else str(value)
@@ -0,0 +1,28 @@
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# the job being run, shared by the scripts and the classes they use
+
+# name of the job being run in the current thread, None outside of jobs
+JOB_NAME = contextvars.ContextVar("job_name", default=None)
+
+
+def thread_pool(max_workers):
+    """
+    Create a thread pool whose workers run as part of the job of the thread creating it.
+    """
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=JOB_NAME.set, initargs=(JOB_NAME.get(),))
+
+
+def job_path(config, path):
+    """
+    Path of a file written by a job, the job name is added before the extension,
+    e.g. "/tmp/nbis_staff.consultants.xlsx" for "/tmp/nbis_staff.xlsx".
+    """
+    if not config.get("job"):
+        return path
+    root, extension = os.path.splitext(path)
+    name = re.sub(r'[^\w.-]', '_', config["job"])
+    return f"{root}.{name}{extension}"
@@ -0,0 +1,169 @@
+import atexit
+import copy
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from Metrics import Metrics, write_all
+from jobcontext import JOB_NAME
+
+# run several source spreadsheet to target page jobs from one configuration file
+
+# number of jobs to run at the same time
+DEFAULT_JOB_WORKERS = 4
+
+# configuration sections a job can override
+JOB_SECTIONS = ("nextcloud", "confluence", "checks", "export")
+
+# stages a job can run, in the order they run, a job runs all of them unless it lists its "stages"
+STAGES = ("publish", "check")
+
+
+def job_configs(config):
+    """
+    Get the configuration of every job. Each entry in the "jobs" list has a name, optionally the stages
+    it runs, and overrides for the nextcloud, confluence, checks and export sections, the rest is taken
+    from the main configuration.
+    :param config: Dictionary containing configuration parameters.
+    :return: List of (job name, job configuration) tuples, a single unnamed job if there is no "jobs" list.
+    """
+    if not config.get("jobs"):
+        return [(None, config)]
+
+    result = []
+    base = {key: value for key, value in config.items() if key != "jobs"}
+    for number, job in enumerate(config["jobs"], start=1):
+        name = str(job.get("name") or f"job{number}")
+        job_config = copy.deepcopy(base)
+        for section in JOB_SECTIONS:
+            if job.get(section):
+                job_config[section] = {**(job_config.get(section) or {}), **job[section]}
+        job_config["job"] = name
+        if job.get("stages"):
+            job_config["stages"] = [str(stage).strip().lower() for stage in job["stages"]]
+            unknown = set(job_config["stages"]) - set(STAGES)
+            if unknown:
+                logging.warning(f"Job {name}: unknown stages {', '.join(sorted(unknown))}, use {' or '.join(STAGES)}.")
+        result.append((name, job_config))
+    return result
+
+
+def job_key(config, stage):
+    """
+    Key of a stage of a job, for the download cache and the state store, e.g. "publish" or "publish:consultants".
+    """
+    return f"{stage}:{config['job']}" if config.get("job") else stage
+
+
+def job_stages(config):
+    """
+    Get the stages a job runs.
+    :param config: Configuration of the job from job_configs().
+    :return: List of stage names in the order they run, all of STAGES unless the job lists its "stages".
+    """
+    stages = config.get("stages")
+    return [stage for stage in STAGES if not stages or stage in stages]
+
+
+def select_stage(configs, stage):
+    """
+    Keep the jobs that run a script's stage, "publish_and_check" keeps the jobs that run either stage.
+    :param configs: List of (job name, job configuration) tuples.
+    :param stage: Name of the script's stage, e.g. "publish".
+    :return: List of the (job name, job configuration) tuples of the jobs that run the stage.
+    """
+    script_stages = STAGES if stage == "publish_and_check" else (stage,)
+    selected = []
+    for name, job_config in configs:
+        if set(script_stages) & set(job_stages(job_config)):
+            selected.append((name, job_config))
+        else:
+            logging.info(f"Job {name} does not run the {stage} stage, skipping it.")
+    return selected
+
+
+def select_jobs(args, configs):
+    """
+    Keep the jobs selected with --job, exits if an unknown job is selected.
+    :param args: Command-line arguments.
+    :param configs: Jobs from job_configs().
+    :return: List of the selected (job name, job configuration) tuples.
+    """
+    if configs[0][0] is None or not getattr(args, "job", None):
+        return configs
+    unknown = set(args.job) - {name for name, _ in configs}
+    if unknown:
+        logging.error(f"Unknown jobs: {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    return [(name, job_config) for name, job_config in configs if name in args.job]
+
+
+def run_jobs(args, configs, main, session, all_metrics, max_workers=DEFAULT_JOB_WORKERS):
+    """
+    Run jobs in a worker pool, a job that fails or exits does not stop the others.
+    :param args: Command-line arguments.
+    :param configs: List of (job name, job configuration) tuples.
+    :param main: The script's main(args, config, session, metrics) function.
+    :param session: HttpSession shared by all jobs, each job counts its retries in its own metrics.
+    :param all_metrics: Dictionary of job name to the Metrics instance to record the job in.
+    :param max_workers: Maximum number of jobs to run at the same time, profiled jobs always run one at a time.
+    :return: Dictionary of job name to True if the job succeeded.
+    """
+
+    # memory is traced for the whole process, so concurrent jobs would mix up each other's profiles
+    if getattr(args, "profile", None) and max_workers > 1 and len(configs) > 1:
+        logging.info("Profiling, running the jobs one at a time.")
+        max_workers = 1
+
+    def run_job(name, job_config):
+        token = JOB_NAME.set(name)
+        try:
+            main(args, job_config, session=session.with_metrics(all_metrics[name]), metrics=all_metrics[name])
+            return True
+        except SystemExit as e:
+            return not e.code
+        except Exception as e:
+            logging.exception(f"Job {name} failed: {e}")
+            return False
+        finally:
+            JOB_NAME.reset(token)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip([name for name, _ in configs], executor.map(lambda item: run_job(*item), configs)))
+
+
+def run(args, config, main, stage):
+    """
+    Run a script's main function once, or once per job if the configuration has a "jobs" list.
+    The jobs run in a worker pool sharing one HTTP session, a failing job does not stop the others.
+    Exits with 1 if any job failed.
+    :param args: Command-line arguments, --job selects the jobs to run.
+    :param config: Dictionary containing configuration parameters.
+    :param main: The script's main(args, config, session, metrics) function.
+    :param stage: Name of the script's stage, used in the metrics, e.g. "publish".
+    """
+    configs = job_configs(config)
+    if configs[0][0] is None:
+        main(args, config)
+        return
+    configs = select_stage(select_jobs(args, configs), stage)
+    if not configs:
+        logging.info(f"No job runs the {stage} stage, nothing to do.")
+        return
+
+    # one metrics set per job, all written together when the process exits
+    all_metrics = {name: Metrics(job_key(job_config, stage), profile_dir=args.profile) for name, job_config in configs}
+    atexit.register(write_all, list(all_metrics.values()), args.metrics_json, args.metrics_prom)
+
+    # connections, TLS sessions and the per host limits are shared by all jobs
+    from HttpSession import HttpSession
+    session = HttpSession(config)
+
+    logging.info(f"Running {len(configs)} jobs...")
+    results = run_jobs(args, configs, main, session, all_metrics, max_workers=config.get("job_workers", DEFAULT_JOB_WORKERS))
+    session.close()
+
+    failed = [name for name, ok in results.items() if not ok]
+    if failed:
+        logging.error(f"{len(failed)} of {len(results)} jobs failed: {', '.join(failed)}")
+        sys.exit(1)
+    logging.info(f"All {len(results)} jobs finished successfully.")
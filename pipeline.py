@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from Confluence import DEFAULT_MAX_WORKERS
+from Metrics import Metrics
+import spreadsheet
+import jobs
+
+# the steps the scripts share: setting up the metrics and loading the spreadsheet, in asyncio mode
+# while the Confluence pages are fetched
+
+# sheets each stage reads
+STAGE_SHEETS = {
+    'publish': spreadsheet.publish_sheets,
+    'check': spreadsheet.check_sheets,
+}
+
+
+def run_metrics(args, metrics, name):
+    """
+    Get the Metrics instance to record a run in.
+    :param args: Command-line arguments.
+    :param metrics: Metrics instance given to the script's main(), or None.
+    :param name: Name of the run, used as the job label of new metrics, e.g. "publish".
+    :return: The given metrics, or new ones that are written when the process exits.
+    """
+
+    # write the metrics however the run ends, runs that exit early are reported as failed unless skipped
+    if metrics is None:
+        metrics = Metrics(name, profile_dir=args.profile)
+        atexit.register(metrics.write, args.metrics_json, args.metrics_prom)
+    return metrics
+
+
+def load_spreadsheet(args, config, nextcloud, metrics, stages, confluence=None):
+    """
+    Download the spreadsheet once and parse the sheets of the stages, exits if it fails or if with --skip-unchanged
+    every stage has already handled this version.
+    With a Confluence instance and the publish stage, the Confluence pages are fetched at the same time. They are
+    fetched during the download unless the download may find nothing to publish, then only during the parse.
+    :param args: Command-line arguments.
+    :param config: Dictionary containing configuration parameters.
+    :param nextcloud: Nextcloud instance.
+    :param metrics: Metrics instance to record the run in.
+    :param stages: Stages of the script, e.g. ["publish", "check"].
+    :param confluence: Confluence instance to prefetch the pages with, None to not prefetch them.
+    :return: Tuple of (list of the stages still to run, dictionary of stage to the list of (header mapping, rows)
+             tuples of its sheets, prefetched pages and child pages as from run_with_prefetch(), or None and None).
+    """
+
+    def download():
+        with metrics.stage('download'):
+            if not nextcloud.download_spreadsheet():
+                sys.exit(1)
+        metrics.set('bytes_downloaded', nextcloud.bytes_downloaded)
+
+        # find out which stages still have to handle this version of the spreadsheet
+        remaining = [stage for stage in stages if not (args.skip_unchanged and nextcloud.is_processed(jobs.job_key(config, stage)))]
+        if not remaining:
+            logging.info("Spreadsheet unchanged since the last run, nothing to do.")
+            metrics.set('skipped', True)
+            metrics.set('success', True)
+            sys.exit(0)
+        return remaining
+
+    def parse():
+
+        # parse the spreadsheet once, straight from memory or from the snapshot of an earlier parse
+        sheets = {stage: STAGE_SHEETS[stage](config) for stage in stages}
+        logging.info("Loading spreadsheet...")
+        with metrics.stage('parse'):
+            try:
+                data = nextcloud.read_sheets([sheet for stage_sheets in sheets.values() for sheet in stage_sheets])
+            except Exception as e:
+                logging.error(f"Failed to load the spreadsheet: {e}")
+                sys.exit(1)
+        metrics.set('snapshot_used', nextcloud.snapshot_used)
+
+        parsed = {}
+        for stage, stage_sheets in sheets.items():
+            parsed[stage], data = data[:len(stage_sheets)], data[len(stage_sheets):]
+        return parsed
+
+    if confluence is None or 'publish' not in stages:
+        return download(), parse(), None, None
+
+    def prefetch(load):
+        parent_id = config['confluence']['page_id'] if config['confluence'].get('unit_pages') else None
+        return run_with_prefetch(load, confluence, [config['confluence']['page_id']], parent_id=parent_id,
+                                 max_concurrency=config['confluence'].get('max_workers', DEFAULT_MAX_WORKERS))
+
+    # the download can only make the publish stage skip if it has already handled the cached copy
+    if not (args.skip_unchanged and nextcloud.cached_version_processed(jobs.job_key(config, 'publish'))):
+        (remaining, parsed), prefetched, children = prefetch(lambda: (download(), parse()))
+        return remaining, parsed, prefetched, children
+
+    remaining = download()
+    if 'publish' not in remaining:
+        return remaining, parse(), None, None
+    parsed, prefetched, children = prefetch(parse)
+    return remaining, parsed, prefetched, children
+
+
+def run_with_prefetch(load, confluence, page_ids, parent_id=None, max_concurrency=DEFAULT_MAX_WORKERS):
+    """
+    Run load() while the Confluence pages are fetched at the same time, as the pages do not depend on the spreadsheet.
+    :param load: Function that loads the spreadsheet, it is run in a worker thread.
+    :param confluence: Confluence instance to fetch the pages with.
+    :param page_ids: IDs of the pages to fetch.
+    :param parent_id: ID of a page whose child pages are also fetched, or None.
+    :param max_concurrency: Maximum number of Confluence requests in flight at the same time.
+    :return: Tuple of (return value of load(), dictionary of page ID to page as from get_page(),
+             child pages of parent_id as from get_child_pages() or None). Pages that failed to
+             fetch are left out, they are fetched again when they are updated.
+    """
+    loaded, pages, children = asyncio.run(_run_with_prefetch(load, confluence, page_ids, parent_id, max_concurrency))
+
+    # load() exits the run if the spreadsheet could not be loaded or should be skipped
+    if isinstance(loaded, SystemExit):
+        raise loaded
+    return loaded, pages, children
+
+
+async def _run_with_prefetch(load, confluence, page_ids, parent_id, max_concurrency):
+
+    # one thread more than the concurrency limit, so load() never waits for a free thread
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency + 1))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def limited(func, *args):
+        async with semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    def load_or_exit():
+        try:
+            return load()
+        except SystemExit as e:
+            return e
+
+    async def fetch_page(page_id):
+        try:
+            return page_id, await limited(confluence.get_page, page_id)
+        except Exception as e:
+            logging.warning(f"Failed to prefetch page {page_id}: {e}")
+            return page_id, None
+
+    async def fetch_pages():
+        children = None
+        if parent_id is not None:
+            try:
+                children = await limited(confluence.get_child_pages, parent_id)
+            except Exception as e:
+                logging.warning(f"Failed to prefetch the child pages of page {parent_id}: {e}")
+        ids = list(page_ids) + list((children or {}).values())
+        pages = await asyncio.gather(*(fetch_page(page_id) for page_id in ids))
+        logging.debug(f"Prefetched {len(pages)} Confluence pages.")
+        return {page_id: page for page_id, page in pages if page is not None}, children
+
+    loaded, (pages, children) = await asyncio.gather(asyncio.to_thread(load_or_exit), fetch_pages())
+    return loaded, pages, children
@@ -0,0 +1,101 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+from datetime import datetime
+from Nextcloud import Nextcloud
+from HttpSession import HttpSession
+from Confluence import Confluence
+from update_confluence_list import build_staff_list, publish_staff_list
+from check_warnings import check_staff
+from StateStore import StateStore
+from Schema import Schema, report_problems
+import pipeline
+import jobs
+import cli
+
+# update the confluence staff list and run the checks from a single download
+
+
+def main(args, config, session=None, metrics=None):
+    """
+    Download and parse the spreadsheet once, then publish the staff list and run the checks, or only
+    the stages the job lists in its "stages".
+    :param args: Command-line arguments.
+    :param config: Dictionary containing configuration parameters.
+    :param session: Shared HttpSession, a new one is created if None.
+    :param metrics: Metrics instance to record the run in. If None, a new one is created and written when the process exits.
+    """
+
+    metrics = pipeline.run_metrics(args, metrics, 'publish_and_check')
+    session = session or HttpSession(config, metrics=metrics)
+    nextcloud = Nextcloud(config, args, session=session)
+
+    # download and parse the spreadsheet once, in asyncio mode while the Confluence pages are fetched
+    confluence = Confluence(config, args, session=session) if args.use_async else None
+    stages, sheets, prefetched, children = pipeline.load_spreadsheet(args, config, nextcloud, metrics, jobs.job_stages(config), confluence=confluence)
+
+    # convert the cells into typed values once, for both stages
+    with metrics.stage('normalize'):
+        staff_sheets, problems = normalize_sheets(sheets)
+    report_problems(problems)
+    metrics.set('invalid_values', len(problems))
+    rows_parsed = max(len(rows) for _, rows in staff_sheets.values())
+    metrics.set('rows_parsed', rows_parsed)
+    logging.info(f"Spreadsheet loaded successfully ({rows_parsed} staff rows).")
+
+    state = StateStore(args.state) if args.state else None
+
+    # update the confluence page
+    if 'publish' in stages:
+        mod_time = nextcloud.modification_time or datetime.now()
+        header_mapping, staff_rows = staff_sheets['publish']
+        staff_list = build_staff_list(header_mapping, staff_rows)
+        publish_staff_list(config, args, session, staff_list, mod_time, state=state, metrics=metrics, prefetched=prefetched, children=children)
+        nextcloud.mark_processed(jobs.job_key(config, 'publish'))
+
+    # run the checks on the same rows
+    if 'check' in stages:
+        header_mapping, staff_rows = staff_sheets['check']
+        _, exception_rows = sheets['check'][1]
+        check_staff(config, header_mapping, staff_rows, exception_rows, state=state, full_report=args.full, metrics=metrics, session=session)
+        nextcloud.mark_processed(jobs.job_key(config, 'check'))
+
+    metrics.set('success', True)
+
+
+def normalize_sheets(sheets):
+    """
+    Convert the rows of the staff sheets of the stages into typed values. Both stages usually read the same
+    sheet, the checks up to its first blank row, and then those rows are only converted once.
+    :param sheets: Dictionary of stage to its parsed sheets from pipeline.load_spreadsheet(), the staff sheet first.
+    :return: Tuple of (dictionary of stage to the typed (header mapping, rows) tuple of its staff sheet, validation report).
+    """
+    typed = {}
+    problems = []
+    converted = None
+    for stage, ((header_mapping, rows), *_) in sheets.items():
+        if converted is not None and header_mapping == converted[0] and rows == converted[1][:len(rows)]:
+            typed[stage] = (header_mapping, converted[2][:len(rows)])
+            continue
+        typed_rows, stage_problems = Schema(header_mapping).normalize(rows)
+        typed[stage] = (header_mapping, typed_rows)
+        problems += stage_problems
+        converted = converted or (header_mapping, rows, typed_rows)
+    return typed, problems
+
+
+if __name__ == "__main__":
+
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Update the Confluence staff list and check for warnings, using a single download of the spreadsheet.')
+    cli.add_common_arguments(parser)
+    parser.add_argument('--state', type=str, help='Path to a state file, to only report changes since the previous run')
+    parser.add_argument('--full', action='store_true', help='Report all warnings even when using --state')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Fetch the Confluence pages while the spreadsheet is downloaded and parsed')
+    cli.add_job_argument(parser)
+    args = parser.parse_args()
+
+    cli.setup_logging(args)
+    jobs.run(args, cli.load_config(args.config), main, 'publish_and_check')
@@ -0,0 +1,144 @@
+import logging
+
+# shared helpers for reading the staff list spreadsheet
+
+# sheet the checks read if no sheet is configured, publishing reads the active sheet
+STAFF_SHEET = "Staff"
+
+# the Exceptions sheet ends at its first blank row
+EXCEPTIONS_SHEET = ("Exceptions", True)
+
+
+def publish_sheets(config):
+    """
+    Sheets read to publish the staff list: the configured sheet or the active one, up to its last row.
+    :param config: Dictionary containing configuration parameters.
+    :return: List of (sheet name, stop_at_blank) pairs, see read_sheets().
+    """
+    return [(config['nextcloud'].get('sheet'), False)]
+
+
+def check_sheets(config):
+    """
+    Sheets read to run the checks: the configured sheet or the Staff sheet up to its first blank row,
+    and the Exceptions sheet.
+    :param config: Dictionary containing configuration parameters.
+    :return: List of (sheet name, stop_at_blank) pairs, see read_sheets().
+    """
+    return [(config['nextcloud'].get('sheet', STAFF_SHEET), True), EXCEPTIONS_SHEET]
+
+
+def load_workbook(source):
+    """
+    Open a workbook in read-only (streaming) mode.
+    :param source: Path or file object of the spreadsheet.
+    :return: The openpyxl workbook, close it with workbook.close() when done.
+    """
+    # openpyxl is slow to import, only load it when a spreadsheet is actually read
+    import openpyxl
+
+    logging.debug("Opening workbook in read-only mode...")
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+def normalize_header(value):
+    """
+    Normalize a column header so lookups are case-insensitive.
+    """
+    if value is None:
+        return None
+    return str(value).strip().lower()
+
+
+def read_sheet(workbook, sheet_name=None, stop_at_blank=False, blank_at=None):
+    """
+    Read the header of a sheet and get a generator over the remaining rows.
+    :param workbook: Workbook opened with load_workbook().
+    :param sheet_name: Name of the sheet to read, the active sheet if None.
+    :param stop_at_blank: If True, stop at the first row with an empty first column.
+                          Otherwise completely empty rows are skipped.
+    :param blank_at: Optional list, the number of rows yielded before the first row with an empty
+                     first column is appended to it. With it the rows up to the first blank row
+                     can be taken from a read that does not stop there.
+    :return: Tuple of (header mapping, row generator). The header mapping maps lowercased
+             header names to column indexes, the rows are tuples as wide as the header.
+    """
+    sheet = workbook[sheet_name] if sheet_name else workbook.active
+    rows = sheet.iter_rows(values_only=True)
+
+    # create header to column mapping, keeping the first column if a header is repeated
+    header_row = next(rows, ())
+    header_mapping = {}
+    for index, value in enumerate(header_row):
+        header = normalize_header(value)
+        if header is not None and header not in header_mapping:
+            header_mapping[header] = index
+    logging.debug(f"Header mapping for sheet {sheet.title}: {header_mapping}")
+
+    return header_mapping, _iter_rows(rows, len(header_row), stop_at_blank, blank_at)
+
+
+def _iter_rows(rows, width, stop_at_blank, blank_at=None):
+    """
+    Yield data rows padded to the width of the header row.
+    """
+    count = 0
+    for row in rows:
+
+        # check if first column is empty, i.e. end of the list
+        if not row or row[0] is None:
+            if stop_at_blank:
+                return
+            if blank_at is not None and not blank_at:
+                blank_at.append(count)
+
+        # skip empty rows
+        if not any(row):
+            continue
+
+        # read-only sheets may give rows shorter than the header
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        count += 1
+        yield row
+
+
+def iter_records(header_mapping, rows):
+    """
+    Turn rows into dictionaries keyed by the lowercased header names.
+    :param header_mapping: Header mapping from read_sheet().
+    :param rows: Rows from read_sheet().
+    """
+    columns = list(header_mapping.items())
+    for row in rows:
+        yield {header: row[index] for header, index in columns}
+
+
+def read_sheets(source, sheets):
+    """
+    Read several sheets of a spreadsheet into memory. A sheet that is given more than once,
+    e.g. with and without stop_at_blank, is only read once.
+    :param source: Path or file object of the spreadsheet.
+    :param sheets: Sequence of (sheet name, stop_at_blank) pairs, see read_sheet().
+    :return: List with a (header mapping, list of rows) tuple per sheet.
+    """
+    workbook = load_workbook(source)
+    try:
+        titles = [sheet_name or workbook.active.title for sheet_name, _ in sheets]
+        read = {}
+        for title in dict.fromkeys(titles):
+
+            # a read up to the last row also gives the rows up to the first blank row
+            stop_at_blank = all(stop for sheet_title, (_, stop) in zip(titles, sheets) if sheet_title == title)
+            blank_at = []
+            header_mapping, rows = read_sheet(workbook, title, stop_at_blank=stop_at_blank, blank_at=blank_at)
+            rows = list(rows)
+            read[title] = (header_mapping, rows, blank_at[0] if blank_at else len(rows))
+
+        result = []
+        for title, (_, stop_at_blank) in zip(titles, sheets):
+            header_mapping, rows, blank_at = read[title]
+            result.append((header_mapping, rows[:blank_at] if stop_at_blank else rows))
+        return result
+    finally:
+        workbook.close()
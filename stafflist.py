@@ -0,0 +1,138 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import sys
+import cli
+
+# single entry point for all staff list jobs, each subcommand only imports the modules it needs
+
+
+def publish(args, config):
+    from update_confluence_list import main
+    import jobs
+    jobs.run(args, config, main, 'publish')
+
+
+def check(args, config):
+    from check_warnings import main
+    import jobs
+    jobs.run(args, config, main, 'check')
+
+
+def run(args, config):
+    from publish_and_check import main
+    import jobs
+    jobs.run(args, config, main, 'publish_and_check')
+
+
+def watch(args, config):
+    from publish_and_check import main
+    from watch import watch
+    watch(args, config, main, 'publish_and_check')
+
+
+def fetch(args, config):
+    """
+    Download the spreadsheet and save it to --file, using the download cache.
+    With jobs, the spreadsheet of each selected job is saved next to it, e.g. staff.consultants.xlsx.
+    """
+    from Nextcloud import Nextcloud
+    from HttpSession import HttpSession
+    from jobcontext import JOB_NAME, job_path
+    import jobs
+
+    session = HttpSession(config)
+    failed = False
+    for name, job_config in jobs.select_jobs(args, jobs.job_configs(config)):
+        token = JOB_NAME.set(name)
+        try:
+            nextcloud = Nextcloud(job_config, args, session=session)
+            if not nextcloud.download_spreadsheet():
+                failed = True
+                continue
+            path = job_path(job_config, args.file)
+            if not args.keep:
+                nextcloud.save(path)
+            print(path)
+        finally:
+            JOB_NAME.reset(token)
+    session.close()
+    if failed:
+        sys.exit(1)
+
+
+def validate(args, config):
+    """
+    Check that the configuration file has all required settings.
+    """
+    import jobs
+    problems = []
+    for name, job_config in jobs.job_configs(config):
+        job_problems = cli.validate_config(job_config)
+        job_problems += [f"Unknown stage '{stage}'" for stage in job_config.get('stages') or [] if stage not in jobs.STAGES]
+        problems += [f"Job {name}: {problem}" if name else problem for problem in job_problems]
+    for problem in problems:
+        logging.error(problem)
+    if problems:
+        sys.exit(1)
+    print(f"{args.config} is valid.")
+
+
+def build_parser():
+    """
+    Build the argument parser with one subparser per job.
+    """
+    parser = argparse.ArgumentParser(prog='stafflist', description='Publish and check the NBIS staff list.')
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    subparser = subparsers.add_parser('publish', help='Update the Confluence staff list pages')
+    cli.add_common_arguments(subparser)
+    subparser.add_argument('--state', type=str, help='Path to a state file, to report who joined or left the list since the previous run')
+    subparser.add_argument('--async', dest='use_async', action='store_true', help='Fetch the Confluence pages while the spreadsheet is downloaded and parsed')
+    cli.add_job_argument(subparser)
+    subparser.set_defaults(func=publish)
+
+    subparser = subparsers.add_parser('check', help='Check for accounts that should have been closed')
+    cli.add_common_arguments(subparser)
+    subparser.add_argument('--state', type=str, help='Path to a state file, to only report changes since the previous run')
+    subparser.add_argument('--full', action='store_true', help='Report all warnings even when using --state')
+    cli.add_job_argument(subparser)
+    subparser.set_defaults(func=check)
+
+    subparser = subparsers.add_parser('run', help='Publish and check using a single download of the spreadsheet')
+    cli.add_common_arguments(subparser)
+    subparser.add_argument('--state', type=str, help='Path to a state file, to only report changes since the previous run')
+    subparser.add_argument('--full', action='store_true', help='Report all warnings even when using --state')
+    subparser.add_argument('--async', dest='use_async', action='store_true', help='Fetch the Confluence pages while the spreadsheet is downloaded and parsed')
+    cli.add_job_argument(subparser)
+    subparser.set_defaults(func=run)
+
+    subparser = subparsers.add_parser('watch', help='Keep running, publish and check whenever the spreadsheet changes')
+    cli.add_common_arguments(subparser)
+    subparser.add_argument('--state', type=str, help='Path to a state file, to only report changes since the previous run')
+    subparser.add_argument('--full', action='store_true', help='Report all warnings even when using --state')
+    subparser.add_argument('--async', dest='use_async', action='store_true', help='Fetch the Confluence pages while the spreadsheet is downloaded and parsed')
+    cli.add_job_argument(subparser)
+    subparser.set_defaults(func=watch)
+
+    subparser = subparsers.add_parser('fetch', help='Download the spreadsheet to --file')
+    cli.add_common_arguments(subparser)
+    cli.add_job_argument(subparser)
+    subparser.set_defaults(func=fetch)
+
+    subparser = subparsers.add_parser('validate', help='Check the configuration file')
+    subparser.add_argument('-c', '--config', type=str, help='Path to YAML configuration file', required=True)
+    subparser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    subparser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose mode')
+    subparser.set_defaults(func=validate)
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
+    cli.setup_logging(args)
+    args.func(args, cli.load_config(args.config))
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the scripts and the stand-ins are imported from the repository root and benchmarks/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+from Confluence import Confluence, fingerprint
+from HttpSession import HttpSession
+from Renderer import Renderer
+from stand_ins import ConfluenceStandIn, reserialize
+
+STAFF = [
+    {"name": "Anna O'Brien", "unit/team": "Data & Compute", "university": "SU", "role": "Developer <lead>"},
+    {"name": 'Bob "B" Smith', "unit/team": "", "university": "UU", "role": ""},
+]
+
+
+@pytest.fixture
+def confluence():
+    server = ConfluenceStandIn()
+    server.add_page("42", "Staff list")
+    yield server
+    server.stop()
+
+
+def test_fingerprint_ignores_confluence_serialization():
+    html_content = Renderer({}).render(STAFF, datetime(2024, 1, 1, 12, 0))
+    stored = reserialize(html_content).replace("<th><strong>", "<th><p><strong>").replace("</strong></th>", "</strong></p></th>")
+    assert fingerprint(stored) == fingerprint(html_content)
+
+
+def test_fingerprint_ignores_timestamps():
+    renderer = Renderer({})
+    assert fingerprint(renderer.render(STAFF, datetime(2024, 1, 1))) == fingerprint(renderer.render(STAFF, datetime(2024, 2, 1)))
+
+
+def test_fingerprint_sees_cell_changes():
+    renderer = Renderer({})
+    modified = datetime(2024, 1, 1)
+    moved = [STAFF[0], {**STAFF[1], "unit/team": "UU", "university": ""}]
+    assert fingerprint(renderer.render(STAFF, modified)) != fingerprint(renderer.render(moved, modified))
+    assert fingerprint(renderer.render(STAFF, modified)) != fingerprint(renderer.render(STAFF[:1], modified))
+
+
+def test_unchanged_page_is_not_uploaded(confluence):
+    config = {"confluence": {"base_url": confluence.url, "username": "u", "api_key": "k"}}
+    client = Confluence(config, None, session=HttpSession(config))
+    html_content = Renderer({}).render(STAFF, datetime(2024, 1, 1))
+
+    assert client.update_staff_list_page("X", "42", html_content) is True
+    assert client.update_staff_list_page("X", "42", Renderer({}).render(STAFF, datetime(2024, 1, 2))) is False
+    assert [method for method, _ in confluence.requests].count("PUT") == 1
+
+
+def test_put_applied_despite_a_bad_gateway_counts_as_updated(confluence):
+    config = {"confluence": {"base_url": confluence.url, "username": "u", "api_key": "k"}, "http": {"backoff": 0}}
+    session = HttpSession(config)
+    send = session.session.request
+
+    # the proxy answers the first PUT with 502 after the page was updated, the retry gets a version conflict
+    def request(method, url, **kwargs):
+        response = send(method, url, **kwargs)
+        if method == "PUT" and [method for method, _ in confluence.requests].count("PUT") == 1:
+            response.status_code = 502
+        return response
+
+    session.session.request = request
+    client = Confluence(config, None, session=session)
+    html_content = Renderer({}).render(STAFF, datetime(2024, 1, 1))
+
+    assert client.update_staff_list_page("X", "42", html_content) is True
+    assert [method for method, _ in confluence.requests].count("PUT") == 2
+    assert confluence.pages["42"]["version"]["number"] == 2
@@ -0,0 +1,82 @@
+import random
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+from ExceptionIndex import ALL_SERVICES, ExceptionIndex, parse_services
+
+NOW = datetime(2026, 6, 1)
+ALPHABET = "ab.@"
+WILDCARDS = ["*", "?", "[ab]", "[!a]", "[a-b]", "[", "[]a]"]
+
+
+def brute_force(rows, user_mail):
+    """
+    The services of the exceptions that match a mail address, scanning every row with fnmatch.
+    """
+    user_mail = user_mail.strip().lower()
+    services = set()
+    for entry, service in rows:
+        entry = entry.strip().lower()
+        if entry.startswith("@"):
+            entry = "*" + entry
+        if fnmatchcase(user_mail, entry):
+            services.update(parse_services(service))
+    return services
+
+
+def random_text(rng, wildcards):
+    parts = []
+    for _ in range(rng.randint(0, 6)):
+        if wildcards and rng.random() < 0.3:
+            parts.append(rng.choice(WILDCARDS))
+        else:
+            parts.append(rng.choice(ALPHABET))
+    return "".join(parts)
+
+
+def test_lookup_matches_fnmatch():
+    rng = random.Random(0)
+    for _ in range(200):
+        rows = []
+        for _ in range(rng.randint(1, 8)):
+            kind = rng.random()
+            if kind < 0.2:
+                entry = "@" + random_text(rng, False)
+            elif kind < 0.4:
+                entry = "*@" + random_text(rng, False)
+            else:
+                entry = random_text(rng, True)
+            if entry.strip():
+                rows.append((entry if rng.random() < 0.8 else entry.upper(), rng.choice(["github", "slack", "*"])))
+        index = ExceptionIndex(rows, now=NOW)
+        for _ in range(30):
+            user_mail = random_text(rng, False)
+            assert set(index.lookup(user_mail)) == brute_force(rows, user_mail), (rows, user_mail)
+
+
+def test_domain_entries():
+    index = ExceptionIndex([("@Example.com", "github"), ("*@nbis.se", "slack active"), ("*@*.org", "*")], now=NOW)
+    assert index.lookup("Anna@EXAMPLE.com") == {"github active"}
+    assert index.lookup("bob@nbis.se") == {"slack active"}
+    assert index.lookup("cecilia@lab.org") == {ALL_SERVICES}
+
+    # an address without @ is not in a domain
+    assert index.lookup("nbis.se") == set()
+    assert index.lookup("example.com") == set()
+    assert index.lookup("bob@sub.nbis.se") == set()
+    assert index.lookup(None) == set()
+
+
+def test_expired_exceptions_are_not_applied():
+    index = ExceptionIndex([
+        ("anna@nbis.se", "github", datetime(2026, 1, 1)),
+        ("anna@nbis.se", "slack", datetime(2027, 1, 1)),
+        ("@nbis.se", "zoom", "2025-12-31"),
+        ("bob@nbis.se", "github", "not a date"),
+        ("cecilia@nbis.se", "github", None),
+    ], now=NOW)
+    assert index.lookup("anna@nbis.se") == {"slack active"}
+    assert index.lookup("bob@nbis.se") == {"github active"}
+    assert index.lookup("cecilia@nbis.se") == {"github active"}
+    assert [(entry, services) for entry, services, _ in index.expired] == [
+        ("anna@nbis.se", {"github active"}), ("@nbis.se", {"zoom active"})]
@@ -0,0 +1,138 @@
+import argparse
+import os
+import socket
+
+import openpyxl
+import pytest
+import yaml
+
+import jobs
+import jobcontext
+import publish_and_check
+import stafflist
+from conftest import ROOT
+from generate_workbook import make_workbook
+from HttpSession import HttpSession
+from Metrics import Metrics
+from Nextcloud import Nextcloud
+from stand_ins import ConfluenceStandIn, NextcloudStandIn
+
+
+@pytest.fixture
+def nextcloud():
+    server = NextcloudStandIn()
+    server.set_file("staff.xlsx", b"staff")
+    yield server
+    server.stop()
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_job_path():
+    assert jobcontext.job_path({}, "/tmp/nbis_staff.xlsx") == "/tmp/nbis_staff.xlsx"
+    assert jobcontext.job_path({"job": "consultants"}, "/tmp/nbis_staff.xlsx") == "/tmp/nbis_staff.consultants.xlsx"
+    assert jobcontext.job_path({"job": "a/b"}, "staff.xlsx") == "staff.a_b.xlsx"
+
+
+def test_jobs_keep_their_own_retries_logs_and_files(nextcloud, tmp_path):
+    config = {
+        "nextcloud": {"base_url": nextcloud.url, "username": "u", "password": "p", "remote_file_path": "staff.xlsx"},
+        "http": {"retries": 1, "backoff": 0},
+        "jobs": [{"name": "staff", "nextcloud": {"cache_dir": str(tmp_path / "staff")}},
+                 {"name": "broken", "nextcloud": {"base_url": closed_port_url(), "cache_dir": str(tmp_path / "broken")}}],
+    }
+    args = argparse.Namespace(keep=True, file=str(tmp_path / "staff.xlsx"), profile=None)
+    configs = jobs.job_configs(config)
+    all_metrics = {name: Metrics(name) for name, _ in configs}
+    job_names = {}
+
+    def main(args, config, session=None, metrics=None):
+        job_names[config["job"]] = jobcontext.JOB_NAME.get()
+        nextcloud = Nextcloud(config, args, session=session)
+        assert nextcloud.download_spreadsheet()
+
+    results = jobs.run_jobs(args, configs, main, HttpSession(config), all_metrics)
+
+    assert results == {"staff": True, "broken": False}
+    assert job_names == {"staff": "staff", "broken": "broken"}
+    assert "http_retries" not in all_metrics["staff"].values
+    assert all_metrics["broken"].values["http_retries"] == 1
+    assert (tmp_path / "staff.staff.xlsx").read_bytes() == b"staff"
+    assert jobcontext.JOB_NAME.get() is None
+
+
+def documented_config():
+    """
+    The example configuration from config.yaml.dist, with the optional jobs section enabled.
+    """
+    with open(os.path.join(ROOT, "config.yaml.dist")) as f:
+        lines = f.read().splitlines()
+    start = lines.index("#job_workers: 4      # number of jobs to run at the same time")
+    return yaml.safe_load("\n".join(lines[:start] + [line[1:] for line in lines[start:]]))
+
+
+def test_documented_jobs_run_their_stages(tmp_path):
+    config = documented_config()
+    staff_path = config["nextcloud"]["remote_file_path"]
+    consultant_job = config["jobs"][1]
+
+    nextcloud = NextcloudStandIn()
+    confluence = ConfluenceStandIn()
+    try:
+        make_workbook(str(tmp_path / "staff.xlsx"), 50)
+        nextcloud.set_file(staff_path, (tmp_path / "staff.xlsx").read_bytes())
+        consultants = openpyxl.Workbook()
+        consultants.active.title = "Consultants"
+        consultants.active.append(["Name", "Company"])
+        for number in range(12):
+            consultants.active.append([f"Consultant {number}", "Example AB"])
+        consultants.save(tmp_path / "consultants.xlsx")
+        nextcloud.set_file(consultant_job["nextcloud"]["remote_file_path"], (tmp_path / "consultants.xlsx").read_bytes())
+
+        config["nextcloud"].update(base_url=nextcloud.url, cache_dir=str(tmp_path / "cache"))
+        config["confluence"]["base_url"] = confluence.url
+        confluence.add_page(str(config["confluence"]["page_id"]), "Staff list")
+        confluence.add_page(str(consultant_job["confluence"]["page_id"]), "Consultants")
+
+        args = stafflist.build_parser().parse_args(["run", "-c", "config.yaml"])
+        jobs.run(args, config, publish_and_check.main, "publish_and_check")
+    finally:
+        nextcloud.stop()
+        confluence.stop()
+
+    assert sorted(path for method, path in confluence.requests if method == "PUT") == [
+        f"/wiki/api/v2/pages/{config['confluence']['page_id']}", f"/wiki/api/v2/pages/{consultant_job['confluence']['page_id']}"]
+    assert "Example AB" in confluence.pages[str(consultant_job["confluence"]["page_id"])]["body"]["storage"]["value"]
+
+
+def test_scripts_skip_the_jobs_without_their_stage():
+    configs = jobs.job_configs(documented_config())
+    assert [name for name, _ in jobs.select_stage(configs, "check")] == ["staff"]
+    assert [name for name, _ in jobs.select_stage(configs, "publish")] == ["staff", "consultants"]
+    assert [name for name, _ in jobs.select_stage(configs, "publish_and_check")] == ["staff", "consultants"]
+
+
+def test_fetch_saves_the_spreadsheet_of_each_selected_job(nextcloud, tmp_path, capsys):
+    nextcloud.set_file("consultants.xlsx", b"consultants")
+    config = {
+        "nextcloud": {"base_url": nextcloud.url, "username": "u", "password": "p",
+                      "remote_file_path": "staff.xlsx", "cache_dir": str(tmp_path / "cache")},
+        "jobs": [{"name": "staff"}, {"name": "consultants", "nextcloud": {"remote_file_path": "consultants.xlsx"}}],
+    }
+    path = tmp_path / "list.xlsx"
+
+    stafflist.fetch(stafflist.build_parser().parse_args(["fetch", "-c", "x", "-f", str(path)]), config)
+    assert (tmp_path / "list.staff.xlsx").read_bytes() == b"staff"
+    assert (tmp_path / "list.consultants.xlsx").read_bytes() == b"consultants"
+
+    (tmp_path / "list.staff.xlsx").unlink()
+    stafflist.fetch(stafflist.build_parser().parse_args(["fetch", "-c", "x", "-f", str(path), "-j", "consultants"]), config)
+    assert not (tmp_path / "list.staff.xlsx").exists()
+    assert capsys.readouterr().out.splitlines()[-1] == str(tmp_path / "list.consultants.xlsx")
+
+    with pytest.raises(SystemExit):
+        stafflist.fetch(stafflist.build_parser().parse_args(["fetch", "-c", "x", "-j", "unknown"]), config)
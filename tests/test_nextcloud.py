@@ -0,0 +1,97 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from HttpSession import HttpSession
+from Nextcloud import Nextcloud
+from stand_ins import NextcloudStandIn
+
+ARGS = argparse.Namespace(keep=False, file=None)
+
+
+@pytest.fixture
+def server():
+    server = NextcloudStandIn()
+    server.set_file("staff.xlsx", b"version 1")
+    yield server
+    server.stop()
+
+
+def make_nextcloud(server, tmp_path):
+    config = {"nextcloud": {"base_url": server.url, "username": "u", "password": "p",
+                            "remote_file_path": "staff.xlsx", "cache_dir": str(tmp_path)}}
+    return Nextcloud(config, ARGS, session=HttpSession(config))
+
+
+def test_concurrent_jobs_keep_their_processed_markers(server, tmp_path):
+    make_nextcloud(server, tmp_path).download_spreadsheet()
+    jobs = [f"publish:job{number}" for number in range(20)]
+
+    def run_job(job):
+        nextcloud = make_nextcloud(server, tmp_path)
+        assert nextcloud.download_spreadsheet()
+        nextcloud.mark_processed(job)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(run_job, jobs))
+
+    nextcloud = make_nextcloud(server, tmp_path)
+    nextcloud.download_spreadsheet()
+    assert all(nextcloud.is_processed(job) for job in jobs)
+
+
+def test_new_version_keeps_the_markers_of_other_jobs(server, tmp_path):
+    first = make_nextcloud(server, tmp_path)
+    first.download_spreadsheet()
+    first.mark_processed("publish:staff")
+
+    # another job downloads a new version, the old marker no longer applies to it
+    server.set_file("staff.xlsx", b"version 2")
+    second = make_nextcloud(server, tmp_path)
+    second.download_spreadsheet()
+    assert not second.is_processed("publish:staff")
+    second.mark_processed("publish:consultants")
+
+    # the marker is kept, it still records the version the staff job handled
+    assert second._read_cache_meta()["processed"]["publish:staff"] == first.version
+    third = make_nextcloud(server, tmp_path)
+    third.download_spreadsheet()
+    assert third.is_processed("publish:consultants")
+    assert not third.is_processed("publish:staff")
+
+
+def test_unchanged_file_is_not_downloaded_again(server, tmp_path):
+    first = make_nextcloud(server, tmp_path)
+    assert first.download_spreadsheet()
+    assert not first.not_modified
+    assert first.bytes_downloaded == len(b"version 1")
+
+    # the cached copy is sent along as validators, the 304 reply reuses it
+    second = make_nextcloud(server, tmp_path)
+    assert second.download_spreadsheet()
+    assert second.not_modified
+    assert second.bytes_downloaded == 0
+    assert second.get_spreadsheet().read() == b"version 1"
+    assert second.version == first.version
+
+    # a new version is downloaded in full
+    server.set_file("staff.xlsx", b"version 2")
+    third = make_nextcloud(server, tmp_path)
+    assert third.download_spreadsheet()
+    assert not third.not_modified
+    assert third.get_spreadsheet().read() == b"version 2"
+    assert third.version != first.version
+
+
+def test_missing_cache_file_is_downloaded_again(server, tmp_path):
+    first = make_nextcloud(server, tmp_path)
+    first.download_spreadsheet()
+    os.remove(first.cache_file)
+
+    second = make_nextcloud(server, tmp_path)
+    assert second.download_spreadsheet()
+    assert not second.not_modified
+    assert second.get_spreadsheet().read() == b"version 1"
+    assert os.path.exists(second.cache_file)
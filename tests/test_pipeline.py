@@ -0,0 +1,79 @@
+import argparse
+import threading
+
+import pipeline
+from Metrics import Metrics
+
+CONFIG = {"nextcloud": {}, "confluence": {"page_id": "42"}}
+SHEET = ({"name": 0}, [("Anna",)])
+
+
+class FakeNextcloud:
+    def __init__(self, processed, changed, page_fetched):
+        """
+        Nextcloud with a cached copy that the publish stage has processed or not, and a remote file that has
+        changed since or not. The download waits a moment for a page fetch, to see if they overlap.
+        """
+        self.processed = processed
+        self.changed = changed
+        self.page_fetched = page_fetched
+        self.fetched_during_download = None
+        self.bytes_downloaded = 0
+        self.snapshot_used = False
+
+    def download_spreadsheet(self):
+        self.fetched_during_download = self.page_fetched.wait(timeout=0.5)
+        return True
+
+    def cached_version_processed(self, job):
+        return self.processed
+
+    def is_processed(self, job):
+        return self.processed and not self.changed
+
+    def read_sheets(self, sheets):
+        return [SHEET] * len(sheets)
+
+
+class FakeConfluence:
+    def __init__(self, page_fetched):
+        self.page_fetched = page_fetched
+        self.fetched = []
+
+    def get_page(self, page_id):
+        self.fetched.append(page_id)
+        self.page_fetched.set()
+        return {"id": page_id}
+
+
+def load(processed, changed):
+    page_fetched = threading.Event()
+    nextcloud = FakeNextcloud(processed, changed, page_fetched)
+    confluence = FakeConfluence(page_fetched)
+    args = argparse.Namespace(skip_unchanged=True)
+    try:
+        result = pipeline.load_spreadsheet(args, CONFIG, nextcloud, Metrics(), ["publish"], confluence=confluence)
+    except SystemExit as e:
+        result = e
+    return result, nextcloud, confluence
+
+
+def test_pages_are_fetched_during_the_download():
+    (stages, sheets, prefetched, _), nextcloud, _ = load(processed=False, changed=True)
+    assert stages == ["publish"]
+    assert sheets == {"publish": [SHEET]}
+    assert prefetched == {"42": {"id": "42"}}
+    assert nextcloud.fetched_during_download
+
+
+def test_pages_are_fetched_after_the_download_if_it_may_skip():
+    (stages, _, prefetched, _), nextcloud, _ = load(processed=True, changed=True)
+    assert stages == ["publish"]
+    assert prefetched == {"42": {"id": "42"}}
+    assert not nextcloud.fetched_during_download
+
+
+def test_skipped_run_fetches_no_pages():
+    result, _, confluence = load(processed=True, changed=False)
+    assert isinstance(result, SystemExit) and result.code == 0
+    assert confluence.fetched == []
@@ -0,0 +1,65 @@
+import logging
+from datetime import date, datetime
+
+import pytest
+
+from Schema import Schema, parse_bool, parse_date, report_problems
+
+HEADER = {"name": 0, "nbis mail": 1, "employment end": 2, "github active": 3}
+
+
+@pytest.mark.parametrize("value, expected", [
+    (datetime(2024, 5, 31, 12, 30), datetime(2024, 5, 31, 12, 30)),
+    (date(2024, 5, 31), datetime(2024, 5, 31)),
+    (45443, datetime(2024, 5, 31)),
+    (45443.5, datetime(2024, 5, 31, 12)),
+    ("2024-05-31", datetime(2024, 5, 31)),
+    (" 2024-05-31 12:30:00 ", datetime(2024, 5, 31, 12, 30)),
+    ("2024-05-31T12:30:00", datetime(2024, 5, 31, 12, 30)),
+    ("2024/05/31", datetime(2024, 5, 31)),
+    ("20240531", datetime(2024, 5, 31)),
+    ("31.05.2024", datetime(2024, 5, 31)),
+    (None, None),
+    ("  ", None),
+])
+def test_parse_date(value, expected):
+    assert parse_date(value) == expected
+
+
+@pytest.mark.parametrize("value", ["31/05/2024", "next year", 10 ** 9])
+def test_parse_invalid_date(value):
+    with pytest.raises(ValueError):
+        parse_date(value)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), ("Yes", True), (" y ", True), ("TRUE", True), (1, True), ("x", True),
+    ("no", False), ("N", False), ("false", False), (0, False), ("-", False), (None, None), ("", None),
+])
+def test_parse_bool(value, expected):
+    assert parse_bool(value) is expected
+
+
+def test_invalid_cells_are_reported_with_row_and_column(caplog):
+    rows = [
+        (" Anna ", "Anna@NBIS.se ", "2024-05-31", "yes"),
+        ("Bob", "bob at nbis", "soon", "maybe"),
+        ("Cecilia", None, None, None),
+    ]
+    typed_rows, problems = Schema(HEADER).normalize(rows)
+
+    assert typed_rows == [
+        ("Anna", "anna@nbis.se", datetime(2024, 5, 31), True),
+        ("Bob", "bob at nbis", None, False),
+        ("Cecilia", None, None, None),
+    ]
+
+    # rows are numbered from the first row under the header
+    assert problems == [
+        (2, "nbis mail", "bob at nbis", "not a mail address"),
+        (2, "employment end", "soon", "not a date (should be YYYY-MM-DD)"),
+        (2, "github active", "maybe", "not yes or no"),
+    ]
+    with caplog.at_level(logging.WARNING):
+        report_problems(problems)
+    assert caplog.messages[0] == "Row 2, column 'nbis mail': not a mail address ('bob at nbis'), please fix it in the spreadsheet."
@@ -0,0 +1,100 @@
+import os
+import pickle
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as day_time
+
+import SnapshotCache as snapshot_module
+from SnapshotCache import SnapshotCache
+
+SHEETS = (("Staff", False), ("Exceptions", True))
+DATA = [
+    ({"name": 0, "employment end": 1, "hours": 2}, [("Anna", datetime(2024, 5, 31, 12, 30), 7.5), ("Bob", None, True)]),
+    ({"nbis mail": 0, "expires": 1}, [("bob@nbis.se", date(2026, 1, 1)), ("*@example.com", day_time(8, 15))]),
+]
+
+
+def snapshot_files(cache_dir):
+    return sorted(os.listdir(cache_dir)) if os.path.exists(cache_dir) else []
+
+
+def test_snapshot_round_trip(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    data = DATA + [({"duration": 0}, [(timedelta(days=1, seconds=5),)])]
+    cache.save("https://cloud/staff.xlsx", '"etag1"', SHEETS, data)
+    assert cache.load("https://cloud/staff.xlsx", '"etag1"', SHEETS) == data
+    assert all(name.endswith(".json") for name in snapshot_files(str(tmp_path)))
+
+
+def test_snapshot_key(tmp_path, monkeypatch):
+    cache = SnapshotCache(str(tmp_path))
+    cache.save("https://cloud/staff.xlsx", '"etag1"', SHEETS, DATA)
+
+    # another version, sheet specification, source or schema is a different snapshot
+    assert cache.load("https://cloud/staff.xlsx", '"etag2"', SHEETS) is None
+    assert cache.load("https://cloud/staff.xlsx", '"etag1"', SHEETS[:1]) is None
+    assert cache.load("https://cloud/other.xlsx", '"etag1"', SHEETS) is None
+    monkeypatch.setattr(snapshot_module, "SCHEMA_VERSION", snapshot_module.SCHEMA_VERSION + 1)
+    assert cache.load("https://cloud/staff.xlsx", '"etag1"', SHEETS) is None
+
+    # nothing is cached without a version or with the cache turned off
+    cache.save("https://cloud/staff.xlsx", None, SHEETS, DATA)
+    assert cache.load("https://cloud/staff.xlsx", None, SHEETS) is None
+    SnapshotCache(str(tmp_path / "off"), max_mb=0).save("https://cloud/staff.xlsx", '"etag1"', SHEETS, DATA)
+    assert not os.path.exists(tmp_path / "off")
+
+
+def test_new_version_invalidates_the_old_snapshots(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    cache.save("https://cloud/staff.xlsx", '"etag1"', SHEETS, DATA)
+    cache.save("https://cloud/staff.xlsx", '"etag1"', SHEETS[:1], DATA[:1])
+    cache.save("https://cloud/other.xlsx", '"etag1"', SHEETS, DATA)
+    cache.save("https://cloud/staff.xlsx", '"etag2"', SHEETS, DATA)
+
+    assert cache.load("https://cloud/staff.xlsx", '"etag1"', SHEETS) is None
+    assert cache.load("https://cloud/staff.xlsx", '"etag1"', SHEETS[:1]) is None
+    assert cache.load("https://cloud/other.xlsx", '"etag1"', SHEETS) == DATA
+    assert len(snapshot_files(str(tmp_path))) == 2
+
+
+def test_least_recently_used_snapshots_are_pruned(tmp_path):
+    rows = [(f"person.{number}@nbis.se", "x" * 100) for number in range(500)]
+    data = [({"nbis mail": 0, "notes": 1}, rows)]
+    cache = SnapshotCache(str(tmp_path))
+    cache.save("source0", "v1", SHEETS, data)
+    size = os.path.getsize(os.path.join(tmp_path, snapshot_files(str(tmp_path))[0]))
+
+    # room for three snapshots
+    cache = SnapshotCache(str(tmp_path), max_mb=3.5 * size / 1024 / 1024)
+    now = time.time()
+    for number in range(1, 3):
+        cache.save(f"source{number}", "v1", SHEETS, data)
+    for number, path in enumerate(sorted(snapshot_files(str(tmp_path)))):
+        os.utime(os.path.join(tmp_path, path), (now - 100 + number, now - 100 + number))
+
+    # loading a snapshot makes it the most recently used, the oldest other one is pruned
+    assert cache.load("source0", "v1", SHEETS) == data
+    oldest = min(snapshot_files(str(tmp_path)), key=lambda name: os.path.getmtime(os.path.join(tmp_path, name)))
+    cache.save("source3", "v1", SHEETS, data)
+    assert len(snapshot_files(str(tmp_path))) == 3
+    assert oldest not in snapshot_files(str(tmp_path))
+    assert cache.load("source0", "v1", SHEETS) == data
+    assert cache.load("source3", "v1", SHEETS) == data
+
+
+def test_old_pickle_snapshots_are_removed(tmp_path):
+    with open(tmp_path / "0123456789abcdef.0123456789abcdef.0123456789abcdef.pickle", "wb") as f:
+        pickle.dump(DATA, f)
+    cache = SnapshotCache(str(tmp_path))
+    cache.save("https://cloud/staff.xlsx", '"etag1"', SHEETS, DATA)
+    assert [name for name in snapshot_files(str(tmp_path)) if not name.endswith(".json")] == []
+
+
+def test_unreadable_snapshot_is_removed(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    cache.save("https://cloud/staff.xlsx", '"etag1"', SHEETS, DATA)
+    path = os.path.join(tmp_path, snapshot_files(str(tmp_path))[0])
+    with open(path, "w") as f:
+        f.write('[[[["name", 0]], [[{"$": "os.system", "v": "true"}]]]]')
+    assert cache.load("https://cloud/staff.xlsx", '"etag1"', SHEETS) is None
+    assert snapshot_files(str(tmp_path)) == []
@@ -0,0 +1,65 @@
+import io
+
+import openpyxl
+
+import spreadsheet
+from publish_and_check import normalize_sheets
+
+HEADER = ["Name", "NBIS mail", "Employment end"]
+
+
+def make_workbook(active="Staff"):
+    workbook = openpyxl.Workbook()
+    staff = workbook.active
+    staff.title = "Staff"
+    for row in [HEADER, ["Anna", "anna@nbis.se", None], ["Bob", "bob@nbis.se", None],
+                [None, None, None], ["Notes below the list", None, None], [None, "orphan@nbis.se", None]]:
+        staff.append(row)
+    other = workbook.create_sheet("Other")
+    other.append(HEADER)
+    other.append(["Cecilia", "cecilia@nbis.se", None])
+    exceptions = workbook.create_sheet("Exceptions")
+    exceptions.append(["NBIS mail", "Exceptions"])
+    exceptions.append(["anna@nbis.se", "github"])
+    workbook.active = workbook[active]
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def read(content, sheets):
+    return spreadsheet.read_sheets(io.BytesIO(content), sheets)
+
+
+def test_combined_read_matches_the_separate_reads():
+    content = make_workbook()
+    config = {"nextcloud": {}}
+    publish_only = read(content, spreadsheet.publish_sheets(config))
+    check_only = read(content, spreadsheet.check_sheets(config))
+    combined = read(content, spreadsheet.publish_sheets(config) + spreadsheet.check_sheets(config))
+
+    assert combined == publish_only + check_only
+    assert [row[0] for row in publish_only[0][1]] == ["Anna", "Bob", "Notes below the list", None]
+    assert [row[0] for row in check_only[0][1]] == ["Anna", "Bob"]
+
+
+def test_publishing_reads_the_active_sheet_and_checks_the_staff_sheet():
+    content = make_workbook(active="Other")
+    config = {"nextcloud": {}}
+    (_, published), (_, checked), _ = read(content, spreadsheet.publish_sheets(config) + spreadsheet.check_sheets(config))
+    assert [row[0] for row in published] == ["Cecilia"]
+    assert [row[0] for row in checked] == ["Anna", "Bob"]
+
+    config = {"nextcloud": {"sheet": "Other"}}
+    (_, published), (_, checked), _ = read(content, spreadsheet.publish_sheets(config) + spreadsheet.check_sheets(config))
+    assert published == checked
+
+
+def test_shared_rows_are_normalized_once():
+    content = make_workbook()
+    publish_sheet, check_sheet, exception_sheet = read(content, spreadsheet.publish_sheets({"nextcloud": {}}) + spreadsheet.check_sheets({"nextcloud": {}}))
+    typed, problems = normalize_sheets({"publish": [publish_sheet], "check": [check_sheet, exception_sheet]})
+    (_, published), (_, checked) = typed["publish"], typed["check"]
+    assert len(published) == 4
+    assert checked == published[:2]
+    assert problems == []
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from check_warnings import check_staff
+from ExceptionIndex import ExceptionIndex
+from RuleEngine import RuleEngine
+from StateStore import StateStore, diff_states
+
+NOW = datetime(2026, 6, 1)
+HEADER = {"name": 0, "nbis mail": 1, "employment end": 2, "github active": 3, "slack active": 4}
+LEFT = NOW - timedelta(days=200)
+RECENT = NOW - timedelta(days=10)
+
+
+def make_rows():
+    return [
+        ("Anna", "anna@nbis.se", None, True, True),
+        ("Bob", "bob@nbis.se", LEFT, True, False),
+        ("Cecilia", "cecilia@nbis.se", LEFT, True, True),
+        ("David", "david@nbis.se", RECENT, True, True),
+        ("Eva", "eva@example.com", LEFT, False, True),
+        ("Nobody", None, LEFT, True, None),
+    ]
+
+
+EXCEPTIONS = ExceptionIndex([("cecilia@nbis.se", "slack"), ("@example.com", "*")], now=NOW)
+
+
+def test_evaluate_state_gives_the_warnings_of_evaluate():
+    rows = make_rows()
+    rules = RuleEngine({}, HEADER, now=NOW)
+    warnings, state = rules.evaluate_state(rows, EXCEPTIONS)
+
+    assert warnings == RuleEngine({}, HEADER, now=NOW).evaluate(rows, EXCEPTIONS)
+    assert warnings == {"bob@nbis.se": {"github active"}, "cecilia@nbis.se": {"github active"}, None: {"github active"}}
+    assert set(state) == {"anna@nbis.se", "bob@nbis.se", "cecilia@nbis.se", "david@nbis.se", "eva@example.com", "Nobody"}
+    assert state["bob@nbis.se"][1] == {"github active"}
+    assert rules.rows_checked == len(rows)
+
+
+def test_diff_states():
+    previous = {"anna": ("", set()), "bob": ("", {"github active"}), "cecilia": ("", {"github active", "slack active"})}
+    current = {"bob": ("", {"github active"}), "cecilia": ("", {"slack active", "zoom active"}), "david": ("", {"github active"})}
+    assert diff_states(previous, current) == {
+        "joined": ["david"],
+        "left": ["anna"],
+        "new": {"cecilia": {"zoom active"}, "david": {"github active"}},
+        "resolved": {"cecilia": {"github active"}},
+    }
+    assert diff_states(current, current) == {"joined": [], "left": [], "new": {}, "resolved": {}}
+
+
+def test_state_round_trip_reports_only_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr("RuleEngine.datetime", type("FixedDatetime", (datetime,), {"now": staticmethod(lambda: NOW)}))
+    state = StateStore(str(tmp_path / "state.db"))
+    config = {"nextcloud": {}}
+    exception_rows = [("cecilia@nbis.se", "slack")]
+    rows = make_rows()
+    check_staff(config, HEADER, rows, exception_rows, state=state)
+    saved = state.load("check")
+    assert saved["bob@nbis.se"] == ("", {"github active"})
+    assert saved["anna@nbis.se"] == ("", set())
+
+    # Bob's account is closed and Anna leaves with her accounts still active
+    rows[1] = ("Bob", "bob@nbis.se", LEFT, False, False)
+    rows[0] = ("Anna", "anna@nbis.se", LEFT, True, False)
+    _, current = RuleEngine(config, HEADER, now=NOW).evaluate_state(rows, ExceptionIndex(exception_rows, now=NOW))
+    changes = diff_states(saved, current)
+    assert changes["new"] == {"anna@nbis.se": {"github active"}}
+    assert changes["resolved"] == {"bob@nbis.se": {"github active"}}
+    state.close()
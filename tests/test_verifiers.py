@@ -0,0 +1,139 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from HttpSession import HttpSession
+from stand_ins import ConfluenceStandIn, GitHubStandIn
+from verifiers import ConfluenceVerifier, GitHubVerifier, VerificationCache, verify_rows
+
+
+@pytest.fixture
+def github():
+    server = GitHubStandIn()
+    server.set_members("nbis", ["Octocat", "hubber"])
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def confluence():
+    server = ConfluenceStandIn()
+    yield server
+    server.stop()
+
+
+def make_config(tmp_path, github=None, confluence=None, **confluence_settings):
+    verify = {}
+    if github is not None:
+        verify["github"] = {"org": "nbis", "api_url": github.url}
+    if confluence is not None:
+        verify["confluence"] = {"group": "staff", **confluence_settings}
+    return {
+        "nextcloud": {"cache_dir": str(tmp_path)},
+        "confluence": {"base_url": confluence.url if confluence else "http://unused", "username": "u", "api_key": "k"},
+        "verify": verify,
+    }
+
+
+def make_verifier(verifier_class, config, tmp_path):
+    cache = VerificationCache(str(tmp_path / "verify.json"))
+    return verifier_class(config, HttpSession(config), cache)
+
+
+def test_github_membership(tmp_path, github):
+    verifier = make_verifier(GitHubVerifier, make_config(tmp_path, github=github), tmp_path)
+    assert verifier.lookup(["octocat", "hubber", "someone"]) == {"octocat": True, "hubber": True, "someone": False}
+
+
+def test_github_lookups_are_cached(tmp_path, github):
+    verifier = make_verifier(GitHubVerifier, make_config(tmp_path, github=github), tmp_path)
+    verifier.lookup(["octocat", "someone"])
+    requests = len(github.requests)
+    assert verifier.lookup(["octocat", "someone"]) == {"octocat": True, "someone": False}
+    assert len(github.requests) == requests
+
+
+def test_github_login_column(tmp_path, github):
+    config = make_config(tmp_path, github=github)
+    config["verify"]["github"]["login_column"] = "github login"
+    verifier = make_verifier(GitHubVerifier, config, tmp_path)
+    assert verifier.account({"github login": " OctoCat ", "github": "other"}) == "octocat"
+    assert verifier.account({"github login": None}) is None
+
+
+def test_confluence_membership_by_mail(tmp_path, confluence):
+    confluence.set_group("staff", ["current@nbis.se"])
+    verifier = make_verifier(ConfluenceVerifier, make_config(tmp_path, confluence=confluence), tmp_path)
+    assert verifier.lookup(["current@nbis.se", "left@nbis.se"]) == {"current@nbis.se": True, "left@nbis.se": False}
+
+
+def test_confluence_hidden_mail_is_unknown(tmp_path, confluence):
+    confluence.set_group("staff", ["current@nbis.se", {"accountId": "abc", "email": ""}])
+    verifier = make_verifier(ConfluenceVerifier, make_config(tmp_path, confluence=confluence), tmp_path)
+    assert verifier.lookup(["current@nbis.se", "left@nbis.se"]) == {"current@nbis.se": True, "left@nbis.se": None}
+
+    # unknown states are not cached
+    assert verifier.cache.get("confluence", "left@nbis.se") == (False, None)
+
+
+def test_confluence_membership_by_account_id(tmp_path, confluence):
+    confluence.set_group("staff", [{"accountId": "abc", "email": ""}])
+    config = make_config(tmp_path, confluence=confluence, account_column="confluence id")
+    verifier = make_verifier(ConfluenceVerifier, config, tmp_path)
+    assert verifier.account({"confluence id": "abc", "nbis mail": "a@nbis.se"}) == "abc"
+    assert verifier.lookup(["abc", "def"]) == {"abc": True, "def": False}
+
+
+def test_confluence_members_are_paged(tmp_path, confluence):
+    confluence.set_group("staff", [f"person.{i}@nbis.se" for i in range(450)])
+    verifier = make_verifier(ConfluenceVerifier, make_config(tmp_path, confluence=confluence), tmp_path)
+    assert verifier.lookup(["person.449@nbis.se"]) == {"person.449@nbis.se": True}
+    assert len(confluence.requests) == 3
+
+
+def test_confluence_unknown_group(tmp_path, confluence):
+    verifier = make_verifier(ConfluenceVerifier, make_config(tmp_path, confluence=confluence), tmp_path)
+    assert verifier.lookup(["a@nbis.se"]) == {"a@nbis.se": None}
+
+
+def test_cache_expiry_and_save(tmp_path):
+    path = tmp_path / "verify.json"
+    cache = VerificationCache(str(path), ttl_hours=1)
+    cache.put("github", "fresh", True)
+    cache.put("github", "stale", False)
+    cache.entries["github"]["stale"][1] -= 2 * 3600
+    assert cache.get("github", "fresh") == (True, True)
+    assert cache.get("github", "stale") == (False, None)
+
+    # expired entries are dropped when saving
+    cache.save()
+    assert set(json.loads(path.read_text())["github"]) == {"fresh"}
+    assert VerificationCache(str(path), ttl_hours=1).get("github", "fresh") == (True, True)
+
+
+def test_cache_unreadable_file(tmp_path):
+    path = tmp_path / "verify.json"
+    path.write_text("not json")
+    assert VerificationCache(str(path)).get("github", "octocat") == (False, None)
+
+
+def test_verify_rows(tmp_path, github, confluence):
+    confluence.set_group("staff", ["left@nbis.se"])
+    config = make_config(tmp_path, github=github, confluence=confluence)
+    config["verify"]["github"]["login_column"] = "github login"
+    header_mapping = {"nbis mail": 0, "github login": 1, "github active": 2, "confluence active": 3, "employment end": 4}
+    ended = datetime.now() - timedelta(days=365)
+    rows = [
+        ("left@nbis.se", "octocat", False, False, ended),
+        ("gone@nbis.se", "nobody", True, True, ended),
+        ("current@nbis.se", "hubber", True, True, None),
+    ]
+
+    verified = verify_rows(config, header_mapping, rows, lambda row: row[4] is not None)
+    assert verified == [
+        ("left@nbis.se", "octocat", True, True, ended),
+        ("gone@nbis.se", "nobody", False, False, ended),
+        ("current@nbis.se", "hubber", True, True, None),
+    ]
+    assert (tmp_path / "verify.json").exists()
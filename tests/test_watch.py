@@ -0,0 +1,73 @@
+import argparse
+import logging
+
+import pytest
+
+import watch
+from stand_ins import NextcloudStandIn
+
+
+@pytest.fixture
+def server():
+    server = NextcloudStandIn()
+    server.set_file("staff.xlsx", b"version 1")
+    yield server
+    server.stop()
+
+
+def run_watch(config, main, polls, monkeypatch, on_poll=None):
+    """
+    Watch for a number of polls, on_poll(poll) is called after each poll.
+    """
+    slept = []
+
+    def sleep(interval):
+        slept.append(interval)
+        if on_poll:
+            on_poll(len(slept))
+        if len(slept) == polls:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(watch.time, "sleep", sleep)
+    monkeypatch.setattr(watch.signal, "signal", lambda signum, handler: None)
+    args = argparse.Namespace(job=None, keep=False, file=None, profile=None, metrics_json=None, metrics_prom=None)
+    watch.watch(args, config, main, "check")
+    return slept
+
+
+def make_config(server, tmp_path):
+    return {
+        "nextcloud": {"base_url": server.url, "username": "u", "password": "p",
+                      "remote_file_path": "staff.xlsx", "cache_dir": str(tmp_path)},
+        "watch": {"min_interval": 1, "max_interval": 4},
+        "jobs": [{"name": "staff"}, {"name": "consultants", "stages": ["publish"]}],
+    }
+
+
+def test_watch_runs_the_jobs_of_its_stage(server, tmp_path, monkeypatch):
+    ran = []
+    run_watch(make_config(server, tmp_path), lambda args, config, session, metrics: ran.append(config["job"]), 3, monkeypatch)
+    assert ran == ["staff"]
+
+
+def test_failing_job_is_logged_once_per_version(server, tmp_path, monkeypatch, caplog):
+    ran = []
+
+    def main(args, config, session, metrics):
+        ran.append(config["job"])
+        logging.error("Failed to publish")
+        raise RuntimeError("broken")
+
+    def on_poll(poll):
+        if poll == 3:
+            server.set_file("staff.xlsx", b"version 2")
+
+    with caplog.at_level(logging.INFO):
+        slept = run_watch(make_config(server, tmp_path), main, 5, monkeypatch, on_poll)
+
+    # every poll retries the job, its errors are logged at the first failure of each version
+    assert ran == ["staff"] * 5
+    assert [record.message for record in caplog.records if record.message == "Failed to publish"] == ["Failed to publish"] * 2
+    assert [record.message for record in caplog.records if record.message.startswith("Job staff failed")] == [
+        "Job staff failed: broken", "Job staff failed, retrying at every poll."] * 2
+    assert slept == [1, 1.5, 2.25, 1, 1.5]
@@ -2,178 +2,247 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-#import requests
-import yaml
-from requests.auth import HTTPBasicAuth
-import pdb
 import logging
+import hashlib
 import sys
 import os
-import openpyxl
 from datetime import datetime
-from datetime import timedelta
 from Nextcloud import Nextcloud
-from Confluence import Confluence
-from pprint import pprint
+from Confluence import Confluence, DEFAULT_MAX_WORKERS
+from HttpSession import HttpSession
+from Renderer import Renderer
+from StateStore import StateStore, diff_states
+from Metrics import Metrics
+from Schema import Schema, report_problems
+from Roster import Roster
+import pipeline
+import emitters
+import jobs
+import cli
 
 # update the confluence staff list
 
+# title of the per unit pages
+DEFAULT_UNIT_PAGE_TITLE = "NBIS staff: {unit}"
 
-if __name__ == "__main__":
 
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(description='Process some integers.')
-    parser.add_argument('-c', '--config', type=str, help='Path to YAML configuration file', required=True)
-    parser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
-    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose mode')
-    parser.add_argument('-f', '--file', type=str, help='Path to where the stafflist will be downloaded (default: /tmp/)', default='/tmp/nbis_staff.xlsx')
-    parser.add_argument('-k', '--keep', action='store_true', help='Keep the downloaded file after processing')
-    args = parser.parse_args()
+def build_staff_list(header_dict, rows):
+    """
+    Build the roster of staff members from the spreadsheet rows.
+    :param header_dict: Header mapping from spreadsheet.read_sheet().
+    :param rows: Typed rows of the staff sheet from Schema.normalize().
+    :return: Roster of the staff members, sorted by name and indexed for the published views.
+    """
 
-    # Set up logging
-    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    # index the staff members in one pass over the rows
+    logging.debug("Processing the spreadsheet...")
+    staff_list = Roster(header_dict, rows)
 
-    # Enable verbose mode if specified
-    if args.verbose:
-        logging.getLogger().setLevel(logging.INFO)
-        logging.info("Verbose mode enabled.")
+    # sanity check the staff list
+    logging.debug("Sanity checking the staff list...")
+    if len(staff_list) < 10 :
+        # include the hostname in the log message for easier debugging
+        logging.error(f"Staff list seems too short (only {len(staff_list)} entries). Check the spreadsheet and the script. Hostname: {os.uname().nodename}")
+        sys.exit(1)
 
-    # Enable debug mode if specified
-    if args.debug:
-        logging.getLogger().setLevel(logging.DEBUG)
-        logging.debug("Debug mode enabled.")
+    return staff_list
 
-    # Read in user credentials and other configs from the YAML file
-    logging.debug("Reading configuration file...")
-    with open(args.config, 'r') as file:
-        config = yaml.safe_load(file)
 
-    # download the spreadsheet
-    nextcloud = Nextcloud(config, args)
-    nextcloud.download_spreadsheet()
+def filter_current_staff(staff_list):
+    """
+    Get the staff members whose end date has not passed, sorted by name.
+    End dates that could not be parsed are kept.
+    :param staff_list: Roster from build_staff_list().
+    :return: Sorted sequence of the current staff members.
+    """
+    current_staff = staff_list.current()
+    logging.debug(f"Left out {staff_list.ended} staff members whose end date has passed.")
+    return current_staff
+
 
-    # Check if the file exists
-    logging.debug(f"Checking if the file exists at {args.file}...")
-    if not os.path.exists(args.file):
-        logging.error(f"File does not exist: {args.file}")
+def publish_staff_list(config, args, session, staff_list, mod_time, state=None, metrics=None, prefetched=None, children=None):
+    """
+    Render the staff list and upload it to the Confluence page.
+    :param config: Dictionary containing configuration parameters.
+    :param args: Command-line arguments.
+    :param session: Shared HttpSession.
+    :param staff_list: Roster from build_staff_list().
+    :param mod_time: Datetime when the master staff list was last modified.
+    :param state: StateStore to report who joined or left the list since the previous run, or None.
+    :param metrics: Metrics instance to record the run in, or None.
+    :param prefetched: Dictionary of page ID to the pages already fetched by pipeline.run_with_prefetch(), or None.
+    :param children: Child pages of the staff list page already fetched by pipeline.run_with_prefetch(), or None.
+    :return: True if the page was updated, False if no update was needed.
+    """
+    metrics = metrics or Metrics()
+    with metrics.stage('filter'):
+        current_staff = filter_current_staff(staff_list)
+    metrics.set('rows_filtered', len(staff_list) - len(current_staff))
+    confluence = Confluence(config, args, session=session)
+    renderer = Renderer(config)
+    page_id = config['confluence']['page_id']
+
+    # render the html table, and the exported formats in the same pass
+    logging.debug("Rendering the HTML table for staff list...")
+    with metrics.stage('render'):
+        outputs = emitters.render_all(config, current_staff, mod_time)
+        pages = {page_id: outputs['confluence'][1]}
+
+        # add the per unit pages, if configured
+        if config['confluence'].get('unit_pages'):
+            pages.update(build_unit_pages(config, confluence, renderer, staff_list, mod_time, children=children))
+
+    # write the exported formats before the upload, so they do not depend on Confluence being up
+    exports_failed = 0
+    if len(outputs) > 1:
+        with metrics.stage('export'):
+            files_exported, exports_failed = emitters.write_outputs(outputs)
+        metrics.set('files_exported', files_exported)
+
+    # update all pages concurrently
+    logging.debug(f"Updating {len(pages)} Confluence pages...")
+    with metrics.stage('upload'):
+        results = confluence.publish_pages(config['confluence']['space_key'], pages, max_workers=config['confluence'].get('max_workers', DEFAULT_MAX_WORKERS), prefetched=prefetched)
+    metrics.set('pages_updated', list(results.values()).count(True))
+    if None in results.values():
+        logging.error(f"Failed to update {list(results.values()).count(None)} of {len(pages)} Confluence pages.")
         sys.exit(1)
-    logging.info(f"File exists: {args.file}")
-
-    # Load the spreadsheet
-    logging.debug("Loading the spreadsheet...")
-    try:
-        wb = openpyxl.load_workbook(args.file)
-        ws = wb.active
-    except Exception as e:
-        logging.error(f"Failed to load the spreadsheet: {e}")
+    if exports_failed:
+        logging.error(f"Failed to write {exports_failed} of {len(outputs) - 1} exported files.")
         sys.exit(1)
 
-    logging.info("Spreadsheet loaded successfully.")
+    updated = results[page_id]
+    metrics.set('page_updated', updated)
+    if updated:
+        logging.info("Confluence staff list page updated.")
+    else:
+        logging.info("Confluence staff list page unchanged.")
+    if len(pages) > 1:
+        logging.info(f"Updated {list(results.values()).count(True)} of {len(pages)} Confluence pages.")
+
+    # report who joined or left the published list since the previous run
+    if state is not None:
+        current = {staff_member_key(staff_member): (row_hash(staff_member), set()) for staff_member in current_staff}
+        previous = state.load(jobs.job_key(config, 'publish'))
+        changes = diff_states(previous, current)
+
+        # everyone would be a joiner on the first run
+        if not previous:
+            changes['joined'] = []
+            logging.info(f"No previous state, recording {len(current)} staff members.")
+        for key in changes['joined']:
+            logging.info(f"Joined the staff list: {key}")
+        for key in changes['left']:
+            logging.info(f"Left the staff list: {key}")
+        changed = sum(1 for key in current if key in previous and previous[key][0] != current[key][0])
+        logging.info(f"Staff list changes: {len(changes['joined'])} joined, {len(changes['left'])} left, {changed} updated.")
+        state.save(jobs.job_key(config, 'publish'), current)
+
+    return updated
+
+
+def build_unit_pages(config, confluence, renderer, staff_list, mod_time, children=None):
+    """
+    Render one child page of the staff list page per unit/team.
+    Child pages that do not exist yet are created.
+    :param config: Dictionary containing configuration parameters.
+    :param confluence: Confluence instance.
+    :param renderer: Renderer instance.
+    :param staff_list: Roster from build_staff_list().
+    :param mod_time: Datetime when the master staff list was last modified.
+    :param children: Dictionary of title to page ID of the existing child pages, they are fetched if None.
+    :return: Dictionary of page ID to HTML content for the existing child pages.
+    """
+    unit_config = config['confluence']['unit_pages']
+    if not isinstance(unit_config, dict):
+        unit_config = {}
+    title_template = unit_config.get('title', DEFAULT_UNIT_PAGE_TITLE)
+    group_by = unit_config.get('group_by', 'unit/team')
+    parent_id = config['confluence']['page_id']
+
+    # the current staff members by unit, sorted by name
+    units = staff_list.group_by(group_by)
+
+    # find the existing child pages by title
+    if children is None:
+        children = confluence.get_child_pages(parent_id)
+    space_id = None
+
+    pages = {}
+    for unit, unit_staff in sorted(units.items()):
+        title = title_template.format(unit=unit)
+        html_content = renderer.render(unit_staff, mod_time)
+        if title in children:
+            pages[children[title]] = html_content
+            continue
 
-    # get spreadsheet modification time
-    mod_time = datetime.fromtimestamp(os.path.getmtime(args.file))
-    logging.info(f"Spreadsheet last modified time: {mod_time.isoformat()}")
+        # create the missing page with its content right away
+        if space_id is None:
+            space_id = confluence.get_page(parent_id)['spaceId']
+        confluence.create_page(space_id, parent_id, title, html_content)
+
+    return pages
 
 
-    # initialize the html table
-    logging.debug("Initializing the HTML table for staff list...")
-    html_table = f"""
-    <p>This list is generated daily from the central <a href="https://nextcloud.dc.scilifelab.se/apps/onlyoffice/3113254?filePath=%2FNBIS%20TechOps%20Staff%20list%2Fnbis_staff.xlsx">master staff list in Data Center's NextCloud instance</a>.</p>
+def staff_member_key(staff_member):
+    """
+    Get a key identifying a staff member between runs, the mail address if there is one.
+    """
+    return str(staff_member.get('nbis mail') or staff_member['name'])
 
-    <p>Master staff list updated:&nbsp;&nbsp;&nbsp;{mod_time.strftime("%Y-%m-%d %H:%M")}
-This page rendered on:&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;{datetime.now().strftime("%Y-%m-%d %H:%M")}</p>
 
-    <table>
-        <tr>
-            <th><strong>Name</strong></th>
-            <th><strong>Unit</strong></th>
-            <th><strong>Organization</strong></th>
-            <th><strong>Role</strong></th>
-        </tr>
+def row_hash(staff_member):
+    """
+    Hash the content of a staff member dictionary.
     """
+    return hashlib.sha1(repr(sorted(staff_member.items())).encode('utf-8')).hexdigest()
 
-    # get the column headers and make a dictionary of the column names
-    logging.debug("Getting column headers...")
-    headers = [cell.value.lower() if cell.value is not None else cell.value for cell in ws[1]]
-    header_dict = {header: index for index, header in enumerate(headers)}
-    logging.debug(f"Column headers: {header_dict}")
-    #pdb.set_trace()
 
-    # Loop through the rows in the spreadsheet and create the HTML table
-    logging.debug("Processing the spreadsheet...")
-    staff_list = []
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        # Skip empty rows
-        if not any(row):
-            continue
-    
-        # Create a dictionary for each staff member, replace None with empty string
-        staff_member = {header: (row[header_dict[header]] if header in header_dict and row[header_dict[header]] is not None else "") for header in header_dict}
-        staff_list.append(staff_member)
+def main(args, config, session=None, metrics=None):
+    """
+    Download the spreadsheet and publish the staff list.
+    :param args: Command-line arguments.
+    :param config: Dictionary containing configuration parameters.
+    :param session: Shared HttpSession, a new one is created if None.
+    :param metrics: Metrics instance to record the run in. If None, a new one is created and written when the process exits.
+    """
 
-    # sanity check the staff list
-    logging.debug("Sanity checking the staff list...")
-    if len(staff_list) < 10 :
-        # include the hostname in the log message for easier debugging
-        logging.error(f"Staff list seems too short (only {len(staff_list)} entries). Check the spreadsheet and the script. Hostname: {os.uname().nodename}")
-        sys.exit(1)
+    metrics = pipeline.run_metrics(args, metrics, 'publish')
+    session = session or HttpSession(config, metrics=metrics)
+    nextcloud = Nextcloud(config, args, session=session)
 
+    # download and parse the spreadsheet, in asyncio mode while the Confluence pages are fetched
+    confluence = Confluence(config, args, session=session) if args.use_async else None
+    _, sheets, prefetched, children = pipeline.load_spreadsheet(args, config, nextcloud, metrics, ['publish'], confluence=confluence)
+    [(header_dict, rows)] = sheets['publish']
+    mod_time = nextcloud.modification_time or datetime.now()
+    logging.info(f"Spreadsheet last modified time: {mod_time.isoformat()}")
 
-    # sort the staff list by name
-    staff_list.sort(key=lambda x: x['name'])
-
-    today = datetime.today().date()
-
-    # add the staff members to the html table
-    for staff_member in staff_list:
-
-        # skip employees whose end date has passed
-        logging.debug("Filtering out staff members whose end date has passed...")
-        if staff_member['employment end']:
-
-            # check if already datetime
-            if isinstance(staff_member['employment end'], datetime):
-                end_date = staff_member['employment end'].date()
-            else:
-                # else, try to convert it to a date object
-                try:
-                    end_date = datetime.strptime(staff_member['employment end'], "%Y-%m-%d").date()
-                except ValueError as e:
-                    # if it fails, log the error and assume the end date is in the far future to avoid filtering out the staff member
-                    logging.error(f"Failed to parse end date for {staff_member['name']}: {e}. Assuming not ended, but please fix the date format in the spreadsheet (should be YYYY-MM-DD)")
-                    end_date = datetime.max.date()
-
-            # check if the end date is in the past
-            if end_date < today:
-                logging.debug(f"Skipping {staff_member['name']} because their end date ({end_date}) has passed.")
-                continue
-
-        html_table += f"""
-        <tr>
-            <td>{staff_member['name']}</td>
-            <td>{staff_member['unit/team']}</td>
-            <td>{staff_member['university']}</td>
-            <td>{staff_member['role']}</td>
-        </tr>
-        """
-
-    html_table += "\n    </table>"
-
-
-    confluence = Confluence(config, args)
-    logging.debug("Updating the Confluence staff list page...")
-    updated = confluence.update_staff_list_page(config['confluence']['space_key'], config['confluence']['page_id'], html_content=html_table)
-
-    # remove the downloaded file if not keeping it
-    logging.debug("Checking if the file should be removed...")
-    if not args.keep:
-        logging.debug("Removing the downloaded file...")
-        try:
-            os.remove(args.file)
-            logging.info(f"Removed downloaded file: {args.file}")
-        except Exception as e:
-            logging.error(f"Failed to remove file: {e}")
-            sys.exit(2)
-    else:
-        logging.info("Keeping the downloaded file as per user request.")
+    # convert the cells into typed values once
+    with metrics.stage('normalize'):
+        rows, problems = Schema(header_dict).normalize(rows)
+        staff_list = build_staff_list(header_dict, rows)
+    report_problems(problems)
+    metrics.set('invalid_values', len(problems))
+    metrics.set('rows_parsed', len(staff_list))
+
+    state = StateStore(args.state) if args.state else None
+    publish_staff_list(config, args, session, staff_list, mod_time, state=state, metrics=metrics, prefetched=prefetched, children=children)
+
+    # remember that this version of the spreadsheet has been published
+    nextcloud.mark_processed(jobs.job_key(config, 'publish'))
+    metrics.set('success', True)
+
+
+if __name__ == "__main__":
+
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Update the Confluence staff list page from the spreadsheet in Nextcloud.')
+    cli.add_common_arguments(parser)
+    parser.add_argument('--state', type=str, help='Path to a state file, to report who joined or left the list since the previous run')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Fetch the Confluence pages while the spreadsheet is downloaded and parsed')
+    cli.add_job_argument(parser)
+    args = parser.parse_args()
 
+    cli.setup_logging(args)
+    jobs.run(args, cli.load_config(args.config), main, 'publish')
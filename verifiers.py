@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+from requests.auth import HTTPBasicAuth
+from HttpSession import HttpSession
+from Nextcloud import DEFAULT_CACHE_DIR
+from jobcontext import thread_pool
+
+# verify the "<service> active" columns of departed staff against the services themselves
+
+# hours before a looked up account state is looked up again
+DEFAULT_CACHE_TTL_HOURS = 24
+
+# number of accounts to look up at the same time
+DEFAULT_MAX_WORKERS = 8
+
+
+class VerificationCache:
+    def __init__(self, path, ttl_hours=DEFAULT_CACHE_TTL_HOURS):
+        """
+        On-disk cache of looked up account states, so unchanged accounts are not looked up on every run.
+        :param path: Path to the JSON cache file.
+        :param ttl_hours: Hours before a cached state expires.
+        """
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, service, account):
+        """
+        Get the cached state of an account.
+        :return: Tuple of (found, state), found is False if the account is not cached or the entry has expired.
+        """
+        entry = self.entries.get(service, {}).get(account)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return False, None
+        return True, entry[0]
+
+    def put(self, service, account, state):
+        with self.lock:
+            self.entries.setdefault(service, {})[account] = [state, time.time()]
+
+    def save(self):
+        """
+        Atomically write the cache, dropping the expired entries.
+        """
+        now = time.time()
+        entries = {service: {account: entry for account, entry in accounts.items() if now - entry[1] <= self.ttl}
+                   for service, accounts in self.entries.items()}
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_file = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            logging.warning(f"Failed to save the verification cache: {e}")
+
+
+class Verifier:
+    # name of the service, matching the "<service> active" column
+    service = None
+
+    def __init__(self, config, session, cache, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Look up the real state of accounts in a service.
+        :param config: Dictionary containing configuration parameters, the verifier's settings are read from "verify.<service>".
+        :param session: Shared HttpSession.
+        :param cache: VerificationCache instance.
+        :param max_workers: Maximum number of accounts to look up at the same time.
+        """
+        self.config = config
+        self.settings = config['verify'][self.service] or {}
+        self.session = session
+        self.cache = cache
+        self.max_workers = max_workers
+
+    def account(self, record):
+        """
+        Get the account name of a staff member in the service.
+        :param record: Dictionary of lowercased header to typed value of a Staff row.
+        :return: The account name, None if it is not known.
+        """
+        return record.get('nbis mail')
+
+    def lookup(self, accounts):
+        """
+        Look up the state of several accounts, using the cache and looking up the rest concurrently.
+        :param accounts: Account names.
+        :return: Dictionary of account name to True if active, False if not and None if unknown.
+        """
+        states = {}
+        missing = []
+        for account in set(accounts):
+            found, state = self.cache.get(self.service, account)
+            if found:
+                states[account] = state
+            else:
+                missing.append(account)
+
+        logging.debug(f"Looking up {len(missing)} {self.service} accounts, {len(states)} cached.")
+        if missing:
+            for account, state in self.lookup_accounts(missing).items():
+                states[account] = state
+                if state is not None:
+                    self.cache.put(self.service, account, state)
+        return states
+
+    def lookup_accounts(self, accounts):
+        """
+        Look up the state of accounts that are not cached, concurrently with lookup_account().
+        :param accounts: List of account names.
+        :return: Dictionary of account name to True if active, False if not and None if unknown.
+        """
+        with thread_pool(self.max_workers) as executor:
+            return dict(zip(accounts, executor.map(self._lookup_one, accounts)))
+
+    def _lookup_one(self, account):
+        try:
+            return self.lookup_account(account)
+        except Exception as e:
+            logging.warning(f"Failed to look up {self.service} account {account}: {e}")
+            return None
+
+    def lookup_account(self, account):
+        """
+        Look up the state of a single account.
+        :return: True if the account is active, False if not, None if unknown.
+        """
+        raise NotImplementedError
+
+
+class GitHubVerifier(Verifier):
+    service = "github"
+
+    def account(self, record):
+        value = record.get(self.settings.get('login_column', 'github'))
+        return str(value).strip().lower() if value else None
+
+    def lookup_account(self, account):
+        """
+        Check if a GitHub user is a member of the organisation.
+        """
+        api_url = self.settings.get('api_url', 'https://api.github.com')
+        headers = {'Accept': 'application/vnd.github+json'}
+        if self.settings.get('token'):
+            headers['Authorization'] = f"Bearer {self.settings['token']}"
+        response = self.session.get(f"{api_url}/orgs/{quote(self.settings['org'])}/members/{quote(account)}", headers=headers, allow_redirects=False)
+
+        # 302 means the token cannot see the organisation's members
+        if response.status_code == 204:
+            return True
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        raise ValueError(f"unexpected HTTP {response.status_code}")
+
+
+class ConfluenceVerifier(Verifier):
+    service = "confluence"
+
+    def account(self, record):
+        """
+        Get the Confluence accountId from the column set with "account_column", or else the mail address.
+        """
+        if self.settings.get('account_column'):
+            value = record.get(self.settings['account_column'])
+            return str(value).strip() if value else None
+        return super().account(record)
+
+    def lookup_accounts(self, accounts):
+        """
+        Check which accounts are members of the Confluence user group. The members are listed
+        a page at a time, instead of looking up every account on its own.
+        Members are matched on accountId if "account_column" is set, otherwise on their mail address.
+        Confluence leaves out the mail address of members whose profile hides it, so if any are
+        left out, accounts that are not found are unknown rather than inactive.
+        """
+        try:
+            account_ids, emails, hidden = self.group_members()
+        except Exception as e:
+            logging.warning(f"Failed to list the members of Confluence group {self.settings.get('group', 'confluence-users')}: {e}")
+            return {account: None for account in accounts}
+
+        if self.settings.get('account_column'):
+            return {account: account in account_ids for account in accounts}
+        if hidden:
+            logging.warning(f"{hidden} members of Confluence group {self.settings.get('group', 'confluence-users')} hide their mail address, "
+                            "only verifying the accounts that are found. Set verify.confluence.account_column to match on accountId.")
+        return {account: True if account in emails else (None if hidden else False) for account in accounts}
+
+    def group_members(self):
+        """
+        Get the members of the configured group.
+        :return: Tuple of (set of accountIds, set of lowercased mail addresses, number of members without a mail address).
+        """
+        base_url = self.config['confluence']['base_url']
+        auth = HTTPBasicAuth(self.config['confluence']['username'], self.config['confluence']['api_key'])
+        url = f"{base_url}/wiki/rest/api/group/{quote(self.settings.get('group', 'confluence-users'))}/member"
+        params = {'limit': 200, 'start': 0}
+        account_ids = set()
+        emails = set()
+        hidden = 0
+        while True:
+            response = self.session.get(url, params=params, auth=auth)
+            response.raise_for_status()
+            result = response.json()
+            for user in result.get('results', []):
+                if user.get('accountId'):
+                    account_ids.add(user['accountId'])
+                if user.get('email'):
+                    emails.add(user['email'].strip().lower())
+                else:
+                    hidden += 1
+            if result.get('size', 0) < params['limit']:
+                return account_ids, emails, hidden
+            params['start'] += params['limit']
+
+
+# verifiers by service name, add a Verifier subclass here to verify another service
+VERIFIERS = {
+    "github": GitHubVerifier,
+    "confluence": ConfluenceVerifier,
+}
+
+
+def verify_rows(config, header_mapping, rows, is_departed, session=None, metrics=None):
+    """
+    Replace the service columns of departed staff members with the account states looked up in the
+    services configured in the "verify" section. States that could not be looked up are left as they are.
+    :param config: Dictionary containing configuration parameters.
+    :param header_mapping: Header mapping of the Staff sheet from spreadsheet.read_sheet().
+    :param rows: Typed rows of the Staff sheet from Schema.normalize().
+    :param is_departed: Function telling if a row belongs to a departed staff member, e.g. RuleEngine.is_departed.
+    :param session: Shared HttpSession, a new one is created if None.
+    :param metrics: Metrics instance to record the run in, or None.
+    :return: List of rows with the verified states.
+    """
+    verify_config = config.get('verify') or {}
+    session = session or HttpSession(config)
+    cache = VerificationCache(os.path.join(config['nextcloud'].get('cache_dir', DEFAULT_CACHE_DIR), 'verify.json'),
+                              verify_config.get('cache_ttl_hours', DEFAULT_CACHE_TTL_HOURS))
+    rows = list(rows)
+    departed = [i for i, row in enumerate(rows) if is_departed(row)]
+    columns = list(header_mapping.items())
+    records = {i: {header: rows[i][index] for header, index in columns} for i in departed}
+
+    checked = drifted = 0
+    for service, verifier_class in VERIFIERS.items():
+        if service not in verify_config:
+            continue
+        column = f"{service} active"
+        if column not in header_mapping:
+            logging.warning(f"No column named '{column}' in the spreadsheet, not verifying {service}.")
+            continue
+        index = header_mapping[column]
+
+        verifier = verifier_class(config, session, cache, max_workers=verify_config.get('max_workers', DEFAULT_MAX_WORKERS))
+        accounts = {i: verifier.account(records[i]) for i in departed}
+        states = verifier.lookup([account for account in accounts.values() if account])
+
+        # use the looked up state, and report where the spreadsheet is wrong
+        for i, account in accounts.items():
+            state = states.get(account) if account else None
+            if state is None:
+                continue
+            checked += 1
+            if state != (rows[i][index] is True):
+                drifted += 1
+                logging.info(f"{records[i].get('nbis mail') or account}: the spreadsheet says {column} is {rows[i][index]}, {service} says {state}.")
+                row = list(rows[i])
+                row[index] = state
+                rows[i] = tuple(row)
+
+    cache.save()
+    if metrics is not None:
+        metrics.set('accounts_verified', checked)
+        metrics.set('accounts_drifted', drifted)
+    return rows
@@ -0,0 +1,122 @@
+import logging
+import signal
+import sys
+import time
+from HttpSession import HttpSession
+from Metrics import Metrics, write_all
+from Nextcloud import Nextcloud
+from jobcontext import JOB_NAME
+import jobs
+
+# long-running mode that only runs the jobs when their spreadsheet has changed
+
+# seconds between polls right after a change, and at most when nothing changes
+DEFAULT_MIN_INTERVAL = 15
+DEFAULT_MAX_INTERVAL = 60
+
+# the interval grows by this factor for every poll without changes
+INTERVAL_FACTOR = 1.5
+
+
+class RetryFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.retrying = set()
+
+    def filter(self, record):
+        """
+        Leave out the log records of jobs retried on a version they already failed on, unless debug logging is on.
+        Their errors have been logged at the first failure.
+        """
+        if JOB_NAME.get() in self.retrying:
+            return logging.getLogger().isEnabledFor(logging.DEBUG)
+        return True
+
+
+def watch(args, config, main, stage):
+    """
+    Poll the version of each job's spreadsheet and run the job when it has changed.
+    Polling uses PROPFIND or HEAD requests, so nothing is downloaded while the file is unchanged.
+    The HTTP connections, download cache, parsed snapshots and state store are kept between runs.
+    Runs until it is interrupted or terminated.
+    :param args: Command-line arguments, --job selects the jobs to watch.
+    :param config: Dictionary containing configuration parameters, see the optional "watch" section.
+    :param main: The script's main(args, config, session, metrics) function.
+    :param stage: Name of the script's stage, used in the metrics, e.g. "publish_and_check".
+    """
+    watch_config = config.get('watch') or {}
+    min_interval = watch_config.get('min_interval', DEFAULT_MIN_INTERVAL)
+    max_interval = watch_config.get('max_interval', DEFAULT_MAX_INTERVAL)
+
+    # versions that have already been handled are skipped, also right after starting
+    args.skip_unchanged = True
+
+    # stop cleanly when terminated, e.g. by systemd
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    configs = jobs.select_stage(jobs.select_jobs(args, jobs.job_configs(config)), stage)
+    session = HttpSession(config)
+    watched = [(name, job_config, Nextcloud(job_config, args, session=session)) for name, job_config in configs]
+    handled = {}
+    failed = {}
+    interval = min_interval
+
+    # the errors of a job that keeps failing on the same version are logged once
+    retry_filter = RetryFilter()
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(retry_filter)
+
+    logging.info(f"Watching {len(watched)} spreadsheets, polling every {min_interval}-{max_interval} seconds.")
+    try:
+        while True:
+
+            # find the jobs whose spreadsheet has changed since it was last handled
+            changed = []
+            versions = {}
+            for name, job_config, nextcloud in watched:
+                version = nextcloud.remote_version()
+                if version is not None and handled.get(name) != version:
+                    changed.append((name, job_config))
+                    versions[name] = version
+
+            # jobs that failed on the same version are only retried, they do not count as a change
+            new = [name for name, _ in changed if failed.get(name) != versions[name]]
+
+            if changed:
+                if new:
+                    logging.info(f"Spreadsheet changed, running {len(changed)} jobs...")
+                all_metrics = {name: Metrics(jobs.job_key(job_config, stage), profile_dir=args.profile) for name, job_config in changed}
+                retry_filter.retrying = {name for name, _ in changed if name not in new}
+                try:
+                    results = jobs.run_jobs(args, changed, main, session, all_metrics, max_workers=config.get('job_workers', jobs.DEFAULT_JOB_WORKERS))
+                finally:
+                    retry_filter.retrying = set()
+                write_all(list(all_metrics.values()), args.metrics_json, args.metrics_prom)
+
+                # failed jobs are tried again at the next poll, a job that keeps failing is logged once per version
+                for name, ok in results.items():
+                    if ok:
+                        handled[name] = versions[name]
+                        if failed.pop(name, None) is not None:
+                            logging.info(f"Job {name or stage} succeeded again.")
+                    elif failed.get(name) != versions[name]:
+                        failed[name] = versions[name]
+                        logging.error(f"Job {name or stage} failed, retrying at every poll.")
+                    else:
+                        logging.debug(f"Job {name or stage} failed again.")
+
+            # poll often right after a change, retries of failing jobs let the interval grow
+            if new:
+                interval = min_interval
+            else:
+                interval = min(interval * INTERVAL_FACTOR, max_interval)
+
+            logging.debug(f"Next poll in {interval:.0f} seconds.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+        for handler in logging.getLogger().handlers:
+            handler.removeFilter(retry_filter)
+        logging.info("Stopped watching.")